@@ -0,0 +1,153 @@
+"""aggregates.py keeps summary statistics of the timesteps taken by the simulations.
+
+For every combination of strategy, number of agents and call protocol, the store
+keeps the number of simulations, the running mean and variance (computed with
+Welford's algorithm) and the histogram of the timesteps taken. The statistics are
+updated as simulations finish, so reading a summary never has to go through the
+raw results again. The store is saved as a json file in the results directory.
+"""
+
+import json
+import math
+import os
+import os.path
+import pandas as pd
+from results import read_results
+
+AGGREGATES_FILENAME = "aggregates.json"
+
+
+class RunningStats:
+    """The running statistics of the timesteps taken by a set of simulations."""
+
+    def __init__(self):
+        """Initialises empty statistics."""
+        self.count = 0
+        self.mean = 0.0
+        # The sum of squared differences from the mean
+        self.m2 = 0.0
+        # Maps the number of timesteps taken to the number of simulations that took that many
+        self.histogram = {}
+
+    def add(self, timesteps_taken):
+        """Adds the number of timesteps taken by one simulation (Welford's algorithm)."""
+        self.count += 1
+        delta = timesteps_taken - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (timesteps_taken - self.mean)
+        self.histogram[timesteps_taken] = self.histogram.get(timesteps_taken, 0) + 1
+
+    def variance(self):
+        """Returns the sample variance, or NaN if there are less than 2 simulations."""
+        if self.count < 2:
+            return float('nan')
+        return self.m2 / (self.count - 1)
+
+    def std(self):
+        """Returns the sample standard deviation, like pandas' Series.std does."""
+        return math.sqrt(self.variance())
+
+    def timesteps_counters(self):
+        """Returns the histogram with the timesteps as strings, sorted by timesteps.
+
+        This is the format simulations.make_histogram_for_frontend expects.
+        """
+        return {str(timesteps): self.histogram[timesteps] for timesteps in sorted(self.histogram)}
+
+    def to_dict(self):
+        """Returns the statistics as a dictionary that can be stored as json."""
+        return {"count": self.count, "mean": self.mean, "m2": self.m2,
+                "histogram": self.timesteps_counters()}
+
+    @classmethod
+    def from_histogram(cls, histogram):
+        """Creates statistics from a histogram, a dictionary with as keys the number of
+        timesteps taken and as values the number of simulations that took that many."""
+        stats = cls()
+        stats.histogram = dict(histogram)
+        stats.count = sum(histogram.values())
+        if stats.count:
+            stats.mean = sum(timesteps * count for timesteps, count in histogram.items()) / stats.count
+            stats.m2 = sum(count * (timesteps - stats.mean) ** 2 for timesteps, count in histogram.items())
+        return stats
+
+    @classmethod
+    def from_dict(cls, data):
+        """Creates statistics from a dictionary made by to_dict."""
+        stats = cls()
+        stats.count = data["count"]
+        stats.mean = data["mean"]
+        stats.m2 = data["m2"]
+        stats.histogram = {int(timesteps): count for timesteps, count in data["histogram"].items()}
+        return stats
+
+
+class AggregateStore:
+    """Running statistics keyed by (strategy, num_agents, call_protocol)."""
+
+    def __init__(self, filepath=None):
+        """Initialises the store, and loads it from filepath if that file exists.
+
+        Input arguments:
+        filepath -- The json file the store is loaded from and saved to
+        """
+        self.filepath = filepath
+        self.stats = {}
+        if filepath is not None and os.path.exists(filepath):
+            with open(filepath) as json_file:
+                for entry in json.load(json_file):
+                    key = (entry["strategy"], entry["num_agents"], entry["call_protocol"])
+                    self.stats[key] = RunningStats.from_dict(entry)
+
+    @classmethod
+    def for_results(cls, results_dir):
+        """Returns the store that belongs to the results in results_dir."""
+        return cls(os.path.join(results_dir, AGGREGATES_FILENAME))
+
+    def add(self, strategy, num_agents, timesteps_taken, call_protocol=None):
+        """Adds the timesteps taken by one simulation to the statistics of its settings."""
+        key = (strategy, num_agents, call_protocol)
+        if key not in self.stats:
+            self.stats[key] = RunningStats()
+        self.stats[key].add(timesteps_taken)
+
+    def add_many(self, strategy, num_agents, timesteps_taken, call_protocol=None):
+        """Adds the timesteps taken by a list of simulations with the same settings."""
+        for timesteps in timesteps_taken:
+            self.add(strategy, num_agents, timesteps, call_protocol)
+
+    def get(self, strategy, num_agents, call_protocol=None):
+        """Returns the RunningStats of these settings, or None if there are no results."""
+        return self.stats.get((strategy, num_agents, call_protocol))
+
+    def save(self):
+        """Saves the store to its json file."""
+        entries = []
+        for (strategy, num_agents, call_protocol), stats in self.stats.items():
+            entry = {"strategy": strategy, "num_agents": num_agents, "call_protocol": call_protocol}
+            entry.update(stats.to_dict())
+            entries.append(entry)
+        os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+        with open(self.filepath, 'w') as json_file:
+            json.dump(entries, json_file, indent=1)
+
+
+def rebuild_aggregates(results_dir):
+    """Rebuilds the aggregate store of results_dir from all the raw results in it.
+
+    This is only needed for results that were saved without updating the store.
+    The histograms are counted by pandas, so the rows are never looped over in Python.
+    """
+    store = AggregateStore()
+    store.filepath = os.path.join(results_dir, AGGREGATES_FILENAME)
+    df = read_results(results_dir)
+    counts = df.groupby(['Strategy', 'Num Agents', 'Call Protocol'], dropna=False)['Timesteps Taken'].value_counts()
+    histograms = {}
+    for (strategy, num_agents, call_protocol, timesteps_taken), count in counts.items():
+        call_protocol = None if pd.isna(call_protocol) else call_protocol
+        histogram = histograms.setdefault((strategy, int(num_agents), call_protocol), {})
+        histogram[int(timesteps_taken)] = int(count)
+    for key, histogram in histograms.items():
+        store.stats[key] = RunningStats.from_histogram(histogram)
+    store.save()
+    return store
@@ -0,0 +1,254 @@
+"""benchmark.py measures how fast the simulation engines are.
+
+For every engine, strategy and number of agents it measures:
+
+timestep_seconds -- The mean time of one call of exchange_secrets of the model.
+simulate_seconds -- The mean time of one call of Controller.simulate, which adds
+    the bookkeeping of the controller to exchange_secrets.
+runs_per_second -- The number of full simulations per second.
+
+The results are saved as a JSON file. If a baseline JSON file (the results of an
+earlier benchmark) is given, the results are compared to it, and every measurement
+that became slower by more than TOLERANCE is reported as a regression, so that a
+slower hot path is noticed before a long sweep of simulations is started.
+
+Usage:
+    python3 benchmark.py <results.json> [<baseline.json>]
+"""
+
+import datetime
+import json
+import platform
+import sys
+import time
+import numpy as np
+
+from modelController.batch_model import simulate_batch
+from modelController.controller import ENGINES, Controller
+from modelController.kernels import get_backend
+
+# Runs that take more time-steps than this are stopped, because their strategy got stuck
+MAX_TIMESTEPS = 200
+
+# A measurement that is this fraction slower than the baseline is a regression
+TOLERANCE = 0.25
+
+# The engine name of the batch engine, which only has a runs_per_second measurement
+BATCH = 'Batch'
+
+# For every measurement, whether a larger value means that the engine became slower
+METRICS = {
+    'timestep_seconds': True,
+    'simulate_seconds': True,
+    'runs_per_second': False,
+}
+
+
+def make_controller(engine, num_agents, strategy, seed):
+    """Returns a Controller with a started simulation, or None if the engine does not
+    support the strategy."""
+    controller = Controller(num_agents, strategy, engine=engine, seed=seed, max_timesteps=MAX_TIMESTEPS)
+    try:
+        controller.update(num_agents, strategy)
+    except ValueError:
+        return None
+    controller.start_simulation(print_message=False)
+    return controller
+
+
+def time_exchange_secrets(controller, num_timesteps):
+    """Returns the mean time of a call of exchange_secrets of the model, over at most
+    num_timesteps time-steps of the simulation."""
+    model = controller.model
+    elapsed = 0.0
+    timesteps_taken = 0
+    while timesteps_taken < num_timesteps and not model.all_secrets_known():
+        start = time.perf_counter()
+        model.exchange_secrets(timesteps_taken)
+        elapsed += time.perf_counter() - start
+        timesteps_taken += 1
+    return elapsed / max(timesteps_taken, 1)
+
+
+def time_simulate(controller, num_timesteps):
+    """Returns the mean time of a call of Controller.simulate, over at most
+    num_timesteps time-steps of the simulation."""
+    start = time.perf_counter()
+    while controller.timesteps_taken < num_timesteps and not controller.simulation_finished:
+        controller.simulate(print_message=False)
+    return (time.perf_counter() - start) / max(controller.timesteps_taken, 1)
+
+
+def time_runs(controller, min_seconds, max_runs):
+    """Simulates full runs until min_seconds have passed (or max_runs runs are done).
+
+    Output:
+    runs_per_second -- The number of runs per second
+    num_runs -- The number of runs that were simulated
+    timed_out -- True if any of the runs got stuck
+    """
+    num_agents = controller.model.num_agents
+    strategy = controller.model.strategy
+    num_runs = 0
+    timed_out = False
+    start = time.perf_counter()
+    while num_runs < max_runs and (num_runs == 0 or time.perf_counter() - start < min_seconds):
+        while not controller.simulation_finished:
+            controller.simulate(print_message=False)
+        timed_out = timed_out or controller.timed_out
+        num_runs += 1
+        controller.reset_simulation(print_message=False)
+        controller.update(num_agents, strategy)
+        controller.start_simulation(print_message=False)
+    return num_runs / (time.perf_counter() - start), num_runs, timed_out
+
+
+def benchmark(engine, num_agents, strategy, seed=0, num_timesteps=50, min_seconds=1.0, max_runs=100,
+              batch_runs=10):
+    """Measures one engine, strategy and number of agents.
+
+    Input arguments:
+    engine -- One of the keys of controller.ENGINES, or BATCH for the batch engine.
+    num_agents -- The number of agents.
+    strategy -- The strategy the agents use.
+    seed -- The seed of the simulations, every measurement uses the same seed.
+    num_timesteps -- The maximum number of time-steps the per time-step times are averaged over.
+    min_seconds -- The time the full runs are simulated for (at least one run is simulated).
+    max_runs -- The maximum number of full runs.
+    batch_runs -- The number of runs the batch engine simulates together, the batches
+        are repeated until min_seconds have passed.
+
+    Output:
+    result -- A dictionary with the measurements, or None if the engine does not
+        support the strategy.
+    """
+    result = {'engine': engine, 'strategy': strategy, 'num_agents': num_agents}
+    if engine == BATCH:
+        num_runs = 0
+        timed_out = False
+        start = time.perf_counter()
+        while num_runs == 0 or time.perf_counter() - start < min_seconds:
+            try:
+                simulate_batch(num_agents, strategy, batch_runs, seed=seed, max_timesteps=MAX_TIMESTEPS)
+            except ValueError:
+                return None
+            except RuntimeError:
+                timed_out = True
+            num_runs += batch_runs
+        result.update(timestep_seconds=None, simulate_seconds=None, num_runs=num_runs, timed_out=timed_out,
+                      runs_per_second=num_runs / (time.perf_counter() - start))
+        return result
+
+    controller = make_controller(engine, num_agents, strategy, seed)
+    if controller is None:
+        return None
+    result['timestep_seconds'] = time_exchange_secrets(controller, num_timesteps)
+    result['simulate_seconds'] = time_simulate(make_controller(engine, num_agents, strategy, seed), num_timesteps)
+    runs_per_second, num_runs, timed_out = time_runs(make_controller(engine, num_agents, strategy, seed),
+                                                     min_seconds, max_runs)
+    result.update(runs_per_second=runs_per_second, num_runs=num_runs, timed_out=timed_out)
+    return result
+
+
+def run_benchmarks(engines, num_agents_values, strategies, seed=0, print_progress=True, **options):
+    """Measures every combination of engine, number of agents and strategy.
+
+    Every combination is first simulated once with a few agents, so that the kernels
+    of the vectorized engine are compiled before anything is measured.
+    The options are passed to benchmark.
+
+    Output:
+    results -- A dictionary with the metadata of the benchmark, and the list of the
+        measurements of every supported combination.
+    """
+    for engine in engines:
+        for strategy in strategies:
+            benchmark(engine, 10, strategy, seed, num_timesteps=1, min_seconds=0, max_runs=1, batch_runs=1)
+
+    measurements = []
+    for engine in engines:
+        for num_agents in num_agents_values:
+            for strategy in strategies:
+                result = benchmark(engine, num_agents, strategy, seed, **options)
+                if result is None:
+                    continue
+                measurements.append(result)
+                if print_progress:
+                    print(f"{engine:<10} {strategy:<18} {num_agents:>5} agents: "
+                          f"{result['runs_per_second']:10.3f} runs/s")
+    return {
+        'metadata': {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'kernel_backend': get_backend().name,
+            'seed': seed,
+        },
+        'results': measurements,
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance=TOLERANCE):
+    """Compares the measurements of a benchmark to those of a baseline benchmark.
+
+    Only the combinations that are in both benchmarks are compared.
+
+    Output:
+    regressions -- A list of (engine, strategy, num_agents, metric, baseline value,
+        value) tuples, for the measurements that became slower by more than tolerance.
+    """
+    def key(result):
+        return result['engine'], result['strategy'], result['num_agents']
+
+    baseline_results = {key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        if key(result) not in baseline_results:
+            continue
+        baseline_result = baseline_results[key(result)]
+        for metric, larger_is_slower in METRICS.items():
+            value = result[metric]
+            baseline_value = baseline_result.get(metric)
+            if value is None or baseline_value is None:
+                continue
+            if larger_is_slower:
+                slower = value > baseline_value * (1 + tolerance)
+            else:
+                slower = value < baseline_value / (1 + tolerance)
+            if slower:
+                regressions.append((*key(result), metric, baseline_value, value))
+    return regressions
+
+
+def save_results(results, filename):
+    """Saves the results of a benchmark as a JSON file."""
+    with open(filename, 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+def load_results(filename):
+    """Loads the results of a benchmark from a JSON file."""
+    with open(filename) as file:
+        return json.load(file)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        exit("wrong number of arguments, give the name of the results file, and optionally of a baseline file")
+
+    # These are the settings of the benchmark
+    engines = list(ENGINES) + [BATCH]
+    num_agents_values = [10, 50, 100, 500, 2000]
+    strategies = ["Random", "Learn-New-Secrets", "Bubble", "Mathematical",
+     "Call-Me-Once", "Most-useful", "Min-Secrets", "Max-Secrets", "Token", "Spider"]
+
+    results = run_benchmarks(engines, num_agents_values, strategies)
+    save_results(results, sys.argv[1])
+
+    if len(sys.argv) == 3:
+        regressions = compare_to_baseline(results, load_results(sys.argv[2]))
+        for engine, strategy, num_agents, metric, baseline_value, value in regressions:
+            print(f"Regression: {engine} {strategy} {num_agents} agents, {metric} {baseline_value:.6g} -> {value:.6g}")
+        if regressions:
+            exit(1)
+        print("No regressions")
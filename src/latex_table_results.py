@@ -1,10 +1,10 @@
 """This is a quick program to output the mean and standard deviations of the Timesteps Taken in LaTeX tabular format."""
 
-import pandas as pd
+from aggregates import AggregateStore
 
 if __name__ == "__main__":
-	df_filename = "data/timesteps_data.csv"
-	df = pd.read_csv(df_filename, index_col=0)
+	results_dir = "data/timesteps_data"
+	store = AggregateStore.for_results(results_dir)
 
 	strategies = ["Random", "Call-Me-Once", "Learn-New-Secrets",
                     "Bubble", "mathematical", "Token-improved",
@@ -18,9 +18,13 @@ if __name__ == "__main__":
 		average_timesteps = []
 		std_timesteps = []
 		for num_agents in num_agents_values:
-			avg_sd_df = df.loc[(df['Num Agents'] == num_agents) & (df['Strategy'] == strategy) & (df['Call Protocol'] == call_protocol)]
-			average_timesteps.append(f"{(avg_sd_df['Timesteps Taken'].mean(skipna=True)):.2f}")
-			std_timesteps.append(f"{(avg_sd_df['Timesteps Taken'].std(skipna=True)):.2f}") 
+			stats = store.get(strategy, num_agents, call_protocol) or store.get(strategy, num_agents)
+			if stats is None:
+				average_timesteps.append("nan")
+				std_timesteps.append("nan")
+				continue
+			average_timesteps.append(f"{stats.mean:.2f}")
+			std_timesteps.append(f"{stats.std():.2f}")
 
 		for num_agents, avg_timestep, std_timestep in zip(num_agents_values, average_timesteps, std_timesteps):
-			print(f"{strategy}:{num_agents} \t | \t ${float(avg_timestep)} \\pm {float(std_timestep)}$")
\ No newline at end of file
+			print(f"{strategy}:{num_agents} \t | \t ${float(avg_timestep)} \\pm {float(std_timestep)}$")
@@ -1,14 +1,51 @@
 import numpy as np
 
+
+def popcount(bits):
+    """Returns the number of set bits in the integer bitmask bits."""
+    return bin(bits).count("1")
+
+
+# int.bit_count (Python 3.10 and later) counts the bits without making a string
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+
+
+def secret_label(agent_id):
+    """Returns the label of the secret that the agent with id agent_id starts out with."""
+    return f"Secret {agent_id}"
+
+
 class Agent:
 
-    def __init__(self, id, init_message, num_agents):
-        """Init function for an agent. It initialises all the needed fields."""
+    def __init__(self, id, num_agents, secrets_known=None):
+        """Init function for an agent. It initialises all the needed fields.
+
+        The secrets an agent knows are stored as an integer bitmask: bit i is set
+        when the agent knows the secret of agent i. Exchanging secrets is then a
+        bitwise OR, and the number of known secrets is a popcount.
+        The bitmask is dense, not sparse: 1 << id already has id + 1 bits, so the
+        secrets of the population take about n ** 2 / 16 bytes from the start, and
+        n ** 2 / 8 bytes once every agent knows all secrets. The same holds for the
+        connections bitmask, once an agent has called an agent with a high id.
+        The secrets are double-buffered: during a time-step, a call stores the secrets
+        the agent will know after the time-step in next_secrets, and update_secrets
+        makes them the current secrets. Because the bitmasks are immutable integers,
+        this only swaps a reference.
+
+        The secrets_known argument is the array this agent stores its knowledge about
+        how many secrets the other agents know in. The Model passes a row of one
+        matrix shared by the whole population, or a sparse KnowledgeRow for large
+        populations. If it is None, a new array is made.
+        """
         self.id = id
-        self.secrets = {init_message}
-        self.incoming_secrets = set()
-        self.connections = np.full(num_agents, False)
-        self.secrets_known = np.zeros(num_agents, dtype=int)
+        self.secrets = 1 << id
+        self.next_secrets = self.secrets
+        # Bitmask of the agents this agent has had a call with
+        self.connections = 0
+        if secrets_known is None:
+            secrets_known = np.zeros(num_agents, dtype=int)
+        self.secrets_known = secrets_known
         self.called = []
         self.call_targets = dict()
         # If an agent has a token, it can make a call
@@ -24,9 +61,21 @@ class Agent:
         other_agent.has_token = True
 
     def update_secrets(self):
-        """Updates the current set of secrets with the incoming secrets."""
-        self.secrets.update(self.incoming_secrets)
-        self.secrets_known[self.id] = len(self.secrets)
+        """Makes the secrets of the next time-step (next_secrets) the current secrets."""
+        self.secrets = self.next_secrets
+        self.secrets_known[self.id] = self.num_secrets()
+
+    def num_secrets(self):
+        """Returns the number of secrets this agent knows (the popcount of its bitmask)."""
+        return popcount(self.secrets)
+
+    def knows_secret(self, agent_id):
+        """Returns True if this agent knows the secret of the agent with id agent_id."""
+        return (self.secrets >> agent_id) & 1 == 1
+
+    def secret_labels(self):
+        """Returns the secrets this agent knows as 'Secret i' labels, for displaying them."""
+        return [secret_label(i) for i in range(self.secrets.bit_length()) if self.knows_secret(i)]
 
     def update_secrets_known(self, other_agent_secrets_known):
         """Updates the knowledge of this agent about how many secrets other agents know.
@@ -35,10 +84,12 @@ class Agent:
         Balanced-Secrets strategies.
         Input arguments:
             other_agent_secrets_known -- Another agent's list of knowledge about how many
-                secrets all the other agents know.
+                secrets all the other agents know, of the same type as self.secrets_known.
         """
-        for i in range(len(self.secrets_known) - 1):
-            self.secrets_known[i] = max(self.secrets_known[i], other_agent_secrets_known[i])
+        if isinstance(self.secrets_known, np.ndarray):
+            np.maximum(self.secrets_known, other_agent_secrets_known, out=self.secrets_known)
+        else:
+            self.secrets_known.merge(other_agent_secrets_known)
 
     def store_connections(self, other):
         """Stores the other agent's id after calling it.
@@ -46,26 +97,20 @@ class Agent:
         This is useful for the Call-Me-Once strategy,
         where an agent can only call another agent once.
         """
-        self.connections[other.id] = True
+        self.connections |= 1 << other.id
 
     def call_target_solved(self):
         targets = set()
         for target_agent in self.call_targets:
-            solved = True
-            for target_secret in target_agent.secrets:
-                if target_secret not in self.secrets:
-                    solved = False
-                    break
-            if solved:
+            if target_agent.secrets & ~self.secrets == 0:
                 targets.add(target_agent)
         return targets
 
     def target_secrets(self):
-        targets = set()
+        """Returns the bitmask of secrets the call targets know, but this agent does not."""
+        targets = 0
         for target_agent in self.call_targets:
-            for target_secret in target_agent.secrets:
-                if target_secret not in self.secrets:
-                    targets.add(target_secret)
+            targets |= target_agent.secrets & ~self.secrets
         return targets
 
     def __repr__(self):
@@ -77,4 +122,4 @@ class Agent:
 
     def print_info(self):
         """Prints out the id, secrets, strategy and connections of an agent."""
-        print(f"id: {self.id}\nsecrets: {self.secrets}\nstrategy: {self.strategy}\nconnections: {self.connections}")
\ No newline at end of file
+        print(f"id: {self.id}\nsecrets: {self.secret_labels()}\nstrategy: {self.strategy}\nconnections: {self.connections}")
\ No newline at end of file
@@ -0,0 +1,253 @@
+"""async_model.py simulates gossip in continuous time, driven by events.
+
+Instead of lock-step time-steps, every agent tries to make a call at random
+moments: the time between the calls of an agent is drawn from an inter-call
+distribution, and a call takes a time drawn from a call-duration distribution.
+The calls are events in a priority queue, so the simulation jumps from event to
+event and never sweeps over all agents. The secrets of a call are exchanged when
+the call ends. An agent that is in a call cannot be called by other agents.
+
+The completion time is reported in simulated time, and as that time divided by
+the length of a round, the expected time from the start of a call of an agent
+to the start of its next call (the mean inter-call time plus the mean call
+duration). The agents do not call in lock-step, so this is not a count of rounds,
+but it can be compared to the time-steps of the synchronous engines.
+"""
+
+import heapq
+import numpy as np
+from modelController.agent import Agent
+from modelController.knowledge import KnowledgeRow
+from modelController.protocols import STANDARD, get_protocol
+from modelController.strategies import get_strategy
+
+
+class ConstantDistribution:
+    """A distribution that always gives the same value."""
+
+    def __init__(self, value):
+        self.value = value
+        self.mean = value
+
+    def sample(self, rng):
+        return self.value
+
+
+class ExponentialDistribution:
+    """An exponential distribution with the given mean, the waiting times of a Poisson process."""
+
+    def __init__(self, mean):
+        self.mean = mean
+
+    def sample(self, rng):
+        return rng.exponential(self.mean)
+
+
+class UniformDistribution:
+    """A uniform distribution between low and high."""
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+        self.mean = (low + high) / 2
+
+    def sample(self, rng):
+        return rng.uniform(self.low, self.high)
+
+
+# The kinds of events, a call attempt of an agent and the end of a call
+CALL = 0
+END_CALL = 1
+
+
+class AsyncModel:
+    """An event-driven simulation engine.
+
+    Only the strategies that choose a uniformly random eligible agent (not the
+    scheduled strategies and not the strategies that use secrets_known), and the
+    call protocols with calls between two agents, can be simulated by this engine.
+    """
+
+    # The number of random idle agents choose_callable_agent tries before it builds the callable list
+    MAX_REJECTIONS = 8
+    # By default, a simulation is stopped after this many rounds of simulated time,
+    # because some strategies (like Call-Me-Once with Push) can get stuck
+    MAX_ROUNDS = 10000
+
+    def __init__(self, num_agents, strategy, rng=None, protocol=STANDARD,
+                 inter_call=None, call_duration=None):
+        """Initialises the model.
+
+        Input arguments:
+        num_agents -- The number of agents in the simulation.
+        strategy -- The strategy the agents will use.
+        rng -- The seed or numpy.random.Generator all random choices are drawn from.
+        protocol -- The call protocol the agents will use.
+        inter_call -- The distribution of the time between the calls of an agent,
+            an ExponentialDistribution with mean 1 if None.
+        call_duration -- The distribution of the duration of a call, 0 if None.
+        """
+        self.rng = np.random.default_rng(rng)
+        self.num_agents = num_agents
+        self.strategy = strategy
+        self.strategy_plugin = get_strategy(strategy)
+        if self.strategy_plugin.scheduled or self.strategy_plugin.uses_secrets_known:
+            raise ValueError(f"The strategy {strategy} is not supported by the event-driven engine")
+        self.protocol = protocol
+        self.protocol_plugin = get_protocol(protocol)
+        if self.protocol_plugin.call_size > 2:
+            raise ValueError(f"The call protocol {protocol} is not supported by the event-driven engine")
+        self.inter_call = inter_call or ExponentialDistribution(1.0)
+        self.call_duration = call_duration or ConstantDistribution(0.0)
+
+        self.agents = [Agent(i, num_agents, KnowledgeRow(num_agents)) for i in range(num_agents)]
+        self.all_secrets = (1 << num_agents) - 1
+        self.num_experts = sum(1 for agent in self.agents if agent.secrets == self.all_secrets)
+        # The idle agents (not in a call), stored like the available agents of Model:
+        # removing an agent swaps it with the last agent, so it costs O(1)
+        self.idle_agents = self.agents.copy()
+        self.idle_positions = list(range(num_agents))
+        # The events, as (time, sequence number, kind, agent id, other id) tuples. The other
+        # id is the called agent for END_CALL, and the number of the attempt for CALL.
+        # The sequence number keeps events at the same time in the order they were added.
+        self.events = []
+        self.num_events = 0
+        # Every agent only has one call attempt that counts, older ones are skipped
+        self.attempts = [0] * num_agents
+        self.time = 0.0
+        self.num_calls = 0
+        self.finished = self.num_experts == num_agents
+        self.timed_out = False
+        for agent in self.agents:
+            self.schedule_call(agent)
+
+    def push_event(self, time, kind, agent_id, other_id):
+        """Adds an event to the priority queue."""
+        heapq.heappush(self.events, (time, self.num_events, kind, agent_id, other_id))
+        self.num_events += 1
+
+    def schedule_call(self, agent):
+        """Schedules the next call attempt of the agent, after a random inter-call time.
+
+        Earlier call attempts of the agent that did not happen yet are cancelled.
+        """
+        self.attempts[agent.id] += 1
+        self.push_event(self.time + self.inter_call.sample(self.rng), CALL, agent.id, self.attempts[agent.id])
+
+    def is_idle(self, agent):
+        """Returns True if the agent is not in a call."""
+        return self.idle_positions[agent.id] >= 0
+
+    def mark_busy(self, agent):
+        """Removes the agent from the idle agents."""
+        position = self.idle_positions[agent.id]
+        last_agent = self.idle_agents.pop()
+        if last_agent is not agent:
+            self.idle_agents[position] = last_agent
+            self.idle_positions[last_agent.id] = position
+        self.idle_positions[agent.id] = -1
+
+    def mark_idle(self, agent):
+        """Adds the agent to the idle agents again."""
+        self.idle_positions[agent.id] = len(self.idle_agents)
+        self.idle_agents.append(agent)
+
+    def choose_callable_agent(self, agent_calling):
+        """Picks a uniformly random idle agent that agent_calling is allowed to call,
+        like Model.choose_callable_agent does, or None if there is no such agent.
+
+        agent_calling was already removed from the idle agents.
+        """
+        num_idle = len(self.idle_agents)
+        if num_idle == 0:
+            return None
+        ineligible = self.strategy_plugin.ineligible_agents(self, agent_calling)
+        for _ in range(self.MAX_REJECTIONS):
+            connection_agent = self.idle_agents[self.rng.integers(num_idle)]
+            if not (ineligible >> connection_agent.id) & 1:
+                return connection_agent
+        callable_agents = [agent for agent in self.idle_agents if not (ineligible >> agent.id) & 1]
+        if not callable_agents:
+            return None
+        return callable_agents[self.rng.integers(len(callable_agents))]
+
+    def start_call(self, agent_calling):
+        """Lets agent_calling try to call an idle agent.
+
+        If it cannot call anyone, it tries again after a random inter-call time.
+        Agents without a token (with Token and Spider) do not call, they wait until
+        they are called.
+        """
+        if not agent_calling.has_token:
+            return
+        self.mark_busy(agent_calling)
+        connection_agent = self.choose_callable_agent(agent_calling)
+        if connection_agent is None:
+            self.mark_idle(agent_calling)
+            self.schedule_call(agent_calling)
+            return
+        self.mark_busy(connection_agent)
+        self.push_event(self.time + self.call_duration.sample(self.rng), END_CALL,
+                        agent_calling.id, connection_agent.id)
+
+    def end_call(self, agent_calling, connection_agent):
+        """Exchanges the secrets of a call that ends now, and lets both agents wait
+        for their next call attempt."""
+        self.protocol_plugin.exchange(agent_calling, [connection_agent])
+        self.strategy_plugin.after_call(agent_calling, connection_agent)
+        agent_calling.store_connections(connection_agent)
+        connection_agent.store_connections(agent_calling)
+        agent_calling.called.append(connection_agent)
+        connection_agent.called.append(agent_calling)
+        self.num_calls += 1
+        for agent in (agent_calling, connection_agent):
+            was_expert = agent.secrets == self.all_secrets
+            agent.update_secrets()
+            if not was_expert and agent.secrets == self.all_secrets:
+                self.num_experts += 1
+            self.mark_idle(agent)
+            self.schedule_call(agent)
+        self.finished = self.num_experts == self.num_agents
+
+    def step(self):
+        """Processes the next event. Returns False if there are no events left."""
+        if not self.events:
+            return False
+        time, _, kind, agent_id, other_id = heapq.heappop(self.events)
+        self.time = time
+        if kind == END_CALL:
+            self.end_call(self.agents[agent_id], self.agents[other_id])
+        elif other_id == self.attempts[agent_id] and self.is_idle(self.agents[agent_id]):
+            self.start_call(self.agents[agent_id])
+        return True
+
+    def run(self, max_time=None):
+        """Processes events until every agent knows all secrets.
+
+        Input arguments:
+        max_time -- The simulation is stopped once the simulated time passes max_time,
+            and timed_out is set. If None, it is MAX_ROUNDS rounds (see round_length).
+
+        Output:
+        time -- The simulated time at which every agent knew all secrets.
+        """
+        if max_time is None:
+            max_time = self.MAX_ROUNDS * self.round_length()
+        while not self.finished:
+            if not self.step():
+                self.timed_out = True
+                break
+            if self.time > max_time:
+                self.timed_out = True
+                break
+        return self.time
+
+    def round_length(self):
+        """Returns the expected time from the start of a call of an agent to the start of its next call."""
+        return self.inter_call.mean + self.call_duration.mean
+
+    def time_in_rounds(self):
+        """Returns the simulated time so far divided by the length of a round (see
+        round_length). This is not the number of rounds the agents made, because the
+        agents do not call in lock-step."""
+        return self.time / self.round_length()
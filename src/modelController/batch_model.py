@@ -0,0 +1,243 @@
+import numpy as np
+from modelController.schedules import get_schedule
+from modelController.protocols import STANDARD, get_protocol
+from modelController.strategies import get_strategy
+
+# The maximum number of bytes the knowledge (and connection) tensors of one batch may use
+MAX_BATCH_BYTES = 2 ** 28
+
+# By default, simulate_batch stops the runs after this many timesteps, because some
+# strategies (like Learn-New-Secrets with Push) can get stuck
+MAX_TIMESTEPS = 10000
+
+
+class BatchModel:
+    """A simulation engine that runs many independent simulations at the same time.
+
+    The knowledge of num_runs replicate runs is stored in one num_runs x n x n
+    boolean tensor: knowledge[r, i, j] is True if agent i of run r knows the secret
+    of agent j. All runs advance together, one timestep at a time, and runs that
+    are finished are dropped from the tensors, so only unfinished runs cost time.
+
+    The semantics of the strategies are the same as in VectorizedModel, and only
+    the strategies that declare a batched_matching (see strategies.py), and the call
+    protocols with calls between two agents, can be simulated.
+    """
+
+    def __init__(self, num_agents, strategy, num_runs, rng=None, protocol=STANDARD, max_timesteps=None):
+        """Initialises the model.
+
+        Input arguments:
+        num_agents -- The number of agents in every run.
+        strategy -- The strategy the agents will use.
+        num_runs -- The number of replicate runs that are simulated together.
+        rng -- The seed or numpy.random.Generator all random choices are drawn from.
+        protocol -- The call protocol the agents will use.
+        max_timesteps -- If not None, run stops after this many timesteps, even if not
+            all runs are finished, like Controller.max_timesteps.
+        """
+        self.rng = np.random.default_rng(rng)
+        self.strategy_plugin = get_strategy(strategy)
+        if self.strategy_plugin.batched_matching is None:
+            raise ValueError(f"The strategy {strategy} is not supported by the batch engine")
+        self.protocol = protocol
+        self.protocol_plugin = get_protocol(protocol)
+        if self.protocol_plugin.call_size > 2:
+            raise ValueError(f"The call protocol {protocol} is not supported by the batch engine")
+        if not self.strategy_plugin.supports_protocol(self.protocol_plugin):
+            raise ValueError(f"The strategy {strategy} cannot be used with the call protocol {protocol}")
+        self.num_agents = num_agents
+        self.strategy = strategy
+        self.num_runs = num_runs
+        self.knowledge = np.tile(np.eye(num_agents, dtype=bool), (num_runs, 1, 1))
+        if self.strategy_plugin.uses_connections:
+            self.connected = np.zeros((num_runs, num_agents, num_agents), dtype=bool)
+        else:
+            self.connected = None
+        # The ids of the runs that are not finished yet, in the order of the tensor rows
+        self.active_runs = np.arange(num_runs)
+        self.timesteps_taken = 0
+        # The number of timesteps each run took, -1 while the run is not finished
+        self.run_timesteps = np.full(num_runs, -1)
+        self.max_timesteps = max_timesteps
+        # True if run stopped because it took max_timesteps timesteps
+        self.timed_out = False
+
+    def random_orders(self, num_active):
+        """Returns a random permutation of the agent ids for every active run."""
+        return np.argsort(self.rng.random((num_active, self.num_agents)), axis=1)
+
+    def make_random_matching(self, orders):
+        """Makes the matchings of all active runs for the Random strategy.
+
+        Just like in VectorizedModel, consecutive agents of a random permutation
+        are paired up.
+
+        Input arguments:
+        orders -- A random permutation of the agent ids for every active run.
+
+        Output:
+        runs, callers, callees -- Flat index arrays, in run runs[k] agent callers[k]
+            calls agent callees[k].
+        """
+        num_active = len(orders)
+        pairs = orders[:, :self.num_agents - self.num_agents % 2].reshape(num_active, -1, 2)
+        runs = np.repeat(np.arange(num_active), pairs.shape[1])
+        return runs, pairs[:, :, 0].ravel(), pairs[:, :, 1].ravel()
+
+    def make_greedy_matching(self, orders):
+        """Makes the matchings of all active runs for the strategies that restrict which
+        agents can be called.
+
+        The k-th agent of every run tries to make a call at the same time, so the
+        agents of one run still choose one after the other in a random order, as in
+        VectorizedModel.make_greedy_matching. A random agent out of the eligible
+        free agents is picked by taking the largest of random keys.
+
+        Input arguments:
+        orders -- A random permutation of the agent ids for every active run.
+
+        Output:
+        runs, callers, callees -- Flat index arrays, in run runs[k] agent callers[k]
+            calls agent callees[k].
+        """
+        num_active = len(orders)
+        rows = np.arange(num_active)
+        free = np.ones((num_active, self.num_agents), dtype=bool)
+        ineligible = self.strategy_plugin.ineligible_matrix(self.knowledge, self.connected)
+
+        runs = []
+        callers = []
+        callees = []
+        for position in range(self.num_agents):
+            agents_calling = orders[:, position]
+            eligible = free & ~ineligible[rows, agents_calling]
+            eligible[rows, agents_calling] = False
+            calling = free[rows, agents_calling] & eligible.any(axis=1)
+
+            keys = self.rng.random((num_active, self.num_agents))
+            keys[~eligible] = -1.0
+            connection_agents = keys.argmax(axis=1)
+
+            calling_rows = rows[calling]
+            free[calling_rows, agents_calling[calling]] = False
+            free[calling_rows, connection_agents[calling]] = False
+            runs.append(calling_rows)
+            callers.append(agents_calling[calling])
+            callees.append(connection_agents[calling])
+        return np.concatenate(runs), np.concatenate(callers), np.concatenate(callees)
+
+    def make_scheduled_matching(self, orders):
+        """Makes the matchings of all active runs for the Bubble and Mathematical strategies.
+
+        The scheduled calls of this timestep are the same in every run. The left over
+        agents are paired up at random in every run, by pairing up consecutive left over
+        agents in the order of the random permutation of the run.
+
+        Input arguments:
+        orders -- A random permutation of the agent ids for every active run.
+
+        Output:
+        runs, callers, callees -- Flat index arrays, in run runs[k] agent callers[k]
+            calls agent callees[k].
+        """
+        num_active = len(orders)
+        callers, callees, left_over = get_schedule(self.strategy, self.num_agents).matching(self.timesteps_taken)
+        is_left_over = np.zeros(self.num_agents, dtype=bool)
+        is_left_over[left_over] = True
+        num_left_over = len(left_over)
+        # Keep the left over agents of every run, in the order of its permutation
+        left_over_orders = orders[is_left_over[orders]].reshape(num_active, num_left_over)
+        pairs = left_over_orders[:, :num_left_over - num_left_over % 2].reshape(num_active, -1, 2)
+
+        runs = np.concatenate([np.repeat(np.arange(num_active), len(callers)),
+                               np.repeat(np.arange(num_active), pairs.shape[1])])
+        all_callers = np.concatenate([np.tile(callers, num_active), pairs[:, :, 0].ravel()])
+        all_callees = np.concatenate([np.tile(callees, num_active), pairs[:, :, 1].ravel()])
+        return runs, all_callers, all_callees
+
+    def exchange_secrets(self):
+        """Performs one timestep of all the runs that are not finished yet.
+
+        The secrets of every call of every run are exchanged in one batched operation.
+        Runs that are finished after this timestep are removed from the tensors.
+        """
+        orders = self.random_orders(len(self.active_runs))
+        batched_matching = self.strategy_plugin.batched_matching
+        if batched_matching == 'random':
+            runs, callers, callees = self.make_random_matching(orders)
+        elif batched_matching == 'scheduled':
+            runs, callers, callees = self.make_scheduled_matching(orders)
+        else:
+            runs, callers, callees = self.make_greedy_matching(orders)
+
+        self.protocol_plugin.spread(self.knowledge, (runs, callers), (runs, callees))
+        if self.connected is not None:
+            self.connected[runs, callers, callees] = True
+            self.connected[runs, callees, callers] = True
+        self.timesteps_taken += 1
+
+        finished = self.knowledge.all(axis=(1, 2))
+        if finished.any():
+            self.run_timesteps[self.active_runs[finished]] = self.timesteps_taken
+            unfinished = ~finished
+            self.active_runs = self.active_runs[unfinished]
+            self.knowledge = self.knowledge[unfinished]
+            if self.connected is not None:
+                self.connected = self.connected[unfinished]
+
+    def run(self):
+        """Simulates all runs until they are all finished, or until max_timesteps
+        timesteps are taken, then timed_out is set.
+
+        Output:
+        run_timesteps -- An array with the number of timesteps each run took, -1 for
+            the runs that did not finish.
+        """
+        while len(self.active_runs) > 0:
+            if self.max_timesteps is not None and self.timesteps_taken >= self.max_timesteps:
+                self.timed_out = True
+                break
+            self.exchange_secrets()
+        return self.run_timesteps
+
+
+def batch_size(num_agents, strategy):
+    """Returns the number of runs that fit in one batch of at most MAX_BATCH_BYTES."""
+    tensors = 2 if get_strategy(strategy).uses_connections else 1
+    return max(1, MAX_BATCH_BYTES // (tensors * num_agents * num_agents))
+
+
+def simulate_batch(num_agents, strategy, num_runs, seed=None, protocol=STANDARD, max_timesteps=MAX_TIMESTEPS):
+    """Simulates num_runs runs with the batch engine and counts the timesteps taken.
+
+    The runs are split up in batches that fit in memory. If a run does not finish
+    within max_timesteps timesteps, a RuntimeError is raised, like the other
+    simulation helpers do.
+
+    Input arguments:
+    num_agents -- The number of agents in every run.
+    strategy -- The strategy the agents will use.
+    num_runs -- The total number of runs.
+    seed -- The seed or numpy.random.Generator all random choices are drawn from.
+    protocol -- The call protocol the agents will use.
+    max_timesteps -- The maximum number of timesteps of a run.
+
+    Output:
+    timesteps_counters -- A dictionary with as keys the timesteps taken (as strings,
+        like simulations.simulate_generator) and as values the number of runs that
+        took that many timesteps.
+    """
+    timesteps_counters = {}
+    rng = np.random.default_rng(seed)
+    size = batch_size(num_agents, strategy)
+    for start in range(0, num_runs, size):
+        model = BatchModel(num_agents, strategy, min(size, num_runs - start), rng, protocol, max_timesteps)
+        run_timesteps = model.run()
+        if model.timed_out:
+            raise RuntimeError(f"A simulation did not finish within {max_timesteps} time-steps")
+        timesteps, counts = np.unique(run_timesteps, return_counts=True)
+        for timesteps_taken, count in zip(timesteps.tolist(), counts.tolist()):
+            key = str(timesteps_taken)
+            timesteps_counters[key] = timesteps_counters.get(key, 0) + count
+    return timesteps_counters
@@ -1,32 +1,82 @@
-from modelController.agent import Agent
 from modelController.model import Model
+from modelController.vectorized_model import VectorizedModel
+from modelController.profiling import instrument
+from modelController.protocols import STANDARD
+from modelController.topology import COMPLETE, make_topology
 import numpy as np
 
+# The simulation engines a controller can use. 'Agents' simulates every agent as
+# an Agent object, 'Vectorized' simulates the whole population as a knowledge matrix.
+ENGINES = {
+    'Agents': Model,
+    'Vectorized': VectorizedModel,
+}
+
 
 class Controller:
 
-    def __init__(self, num_agents, strategy):
+    def __init__(self, num_agents, strategy, engine='Agents', seed=None, max_timesteps=None,
+                 topology=COMPLETE, topology_params=None, protocol=STANDARD, stats=None):
         """Initialises the controller.
 
         Arguments:
         num_agents -- The number of agents that should be in the simulation.
         strategy -- The strategy the agents will use.
+        engine -- The simulation engine to use, one of the keys of ENGINES.
+        seed -- The seed (an int or numpy.random.SeedSequence) or numpy.random.Generator
+            that all random choices of the simulation are drawn from. With the same
+            seed, a sequence of simulations is reproduced exactly. To reproduce a
+            single simulation of a sequence, give every simulation its own seed
+            with reset_simulation.
+        max_timesteps -- If not None, a simulation is stopped after this many time-steps,
+            even if not all agents know all secrets. Some strategies (like Max-Secrets)
+            can get stuck, so that the simulation would never finish otherwise.
+        topology -- The name of the topology the agents can call each other over, one
+            of the keys of topology.TOPOLOGIES, or 'Complete' if every agent can call
+            every other agent. Only the 'Agents' engine supports other topologies.
+        topology_params -- A dictionary with the parameters of the topology, for
+            example {'probability': 0.01} for 'Erdos-Renyi'.
+        protocol -- The call protocol the agents will use, one of the keys of
+            protocols.PROTOCOLS.
+        stats -- If not None, a profiling.SimulationStats object that the time spent
+            in every phase of a time-step is added to, for this simulation and the
+            simulations after a reset. If None, nothing is measured.
         """
-        self.model = Model(strategy)
+        if topology != COMPLETE and engine != 'Agents':
+            raise ValueError(f"The {engine} engine does not support the topology {topology}")
+        self.engine = engine
+        self.topology = topology
+        self.topology_params = topology_params or {}
+        self.rng = np.random.default_rng(seed)
+        self.model = ENGINES[engine](strategy, self.rng, protocol=protocol)
+        self.stats = stats
+        if stats is not None:
+            instrument(self.model, stats)
         self.timesteps_taken = 0
+        # The number of experts (agents that know all secrets) after every time-step,
+        # which shows how fast the simulation converges
+        self.expert_counts = []
         self.simulation_finished = False
+        self.max_timesteps = max_timesteps
+        # True if the simulation was stopped because it took max_timesteps time-steps
+        self.timed_out = False
         self.started = False
         self.paused = False
 
     def init_agents(self):
-        """Re-initialises the agents list and fills it with num_agents agents."""
-        self.model.agents = []
-        for i in range(self.model.num_agents):
-            self.model.agents.append(Agent(i, f"Secret {i}", self.model.num_agents))
-            self.model.all_secrets.add(f"Secret {i}")
+        """Re-initialises the agents of the model, so it holds num_agents agents.
+
+        The topology is made again for the number of agents, so random topologies
+        are drawn anew for every simulation.
+        """
+        if self.topology != COMPLETE:
+            self.model.topology = make_topology(self.topology, self.model.num_agents, self.rng,
+                                                **self.topology_params)
+        self.model.init_agents()
 
     def update(self, num_agents, strategy):
         """This function updates the num_agents and strategy fields.
+        The strategy is resolved to its Strategy object here, once per simulation.
         Then it calls the self.init_agents function so it re-initialises the agents list.
 
         Arguments:
@@ -34,8 +84,7 @@ class Controller:
         strategy -- The strategy the agents will use.
         """
         if not self.started:
-            self.model.strategy = strategy
-            self.model.all_secrets = set()
+            self.model.set_strategy(strategy)
             self.model.num_agents = num_agents
             self.init_agents()
 
@@ -49,8 +98,9 @@ class Controller:
         if print_message:
             print("Started simulation!")
             print('Strategy = ' + self.model.strategy)
-            for agent in self.model.agents:
-                print(agent, end='\t')
+            print('Call protocol = ' + self.model.protocol)
+            for agent_id in range(self.model.num_agents):
+                print(f"Ag({agent_id})", end='\t')
             print()
         self.started = True
 
@@ -73,23 +123,29 @@ class Controller:
         self.paused = False
         print("Stopped simulation!")
 
-    def reset_simulation(self, print_message=True):
+    def reset_simulation(self, print_message=True, seed=None):
         """Resets the simulation (there is a button on the UI calling this function).
 
         It resets it by calling the self.__init__ function with the current values
-        for num_agents and strategy as arguments.
-        Argument:
+        for num_agents and strategy as arguments. If no seed is given, the random
+        generator is kept, so the next simulation continues the same random stream.
+        Arguments:
         print_message -- If set to False, the message 'Simulation reset!' will
             not be printed to stdout
+        seed -- If not None, the seed (an int or numpy.random.SeedSequence) of a
+            new random generator for the next simulation, so that simulation can
+            be reproduced on its own.
         """
-        self.__init__(self.model.num_agents, self.model.strategy)
+        rng = self.rng if seed is None else seed
+        self.__init__(self.model.num_agents, self.model.strategy, self.engine, rng, self.max_timesteps,
+                      self.topology, self.topology_params, self.model.protocol, self.stats)
         if print_message:
             print("Simulation reset!")
 
     def print_agents_secrets(self):
         """Outputs the number of secrets each agent has learned to stdout."""
-        for agent in self.model.agents:
-            print(len(agent.secrets), end='\t')
+        for num_secrets in self.model.secret_counts():
+            print(num_secrets, end='\t')
         print()
 
     def simulate(self, print_message=True):
@@ -99,7 +155,9 @@ class Controller:
         It exchanges secrets, prints the number of secrets to stdout,
         increases the number of time-steps taken and checks whether
         the simulation has finished during this time-step.
-        The simulation is finished if every agent knows all secrets.
+        The simulation is finished if every agent knows all secrets. The model keeps
+        count of the agents that know all secrets, so this check is cheap, and the
+        count is stored in self.expert_counts.
 
         Input arguments:
         'print_secrets' -- When this is set to False, this function
@@ -113,15 +171,15 @@ class Controller:
                 self.print_agents_secrets()
 
             self.timesteps_taken += 1
+            self.expert_counts.append(self.model.num_experts)
 
-            broken_out_of_loop = False
             # If all agents know each secret, simulation is finished
-            for agent in self.model.agents:
-                if len(agent.secrets) < self.model.num_agents:
-                    broken_out_of_loop = True
-                    break
-
-            if not broken_out_of_loop:
+            if self.model.all_secrets_known():
                 self.simulation_finished = True
                 if print_message:
                     print(f"End of simulation, after {self.timesteps_taken} time-steps.")
+            elif self.max_timesteps is not None and self.timesteps_taken >= self.max_timesteps:
+                self.simulation_finished = True
+                self.timed_out = True
+                if print_message:
+                    print(f"Stopped simulation, it did not finish within {self.max_timesteps} time-steps.")
@@ -0,0 +1,175 @@
+"""kernels.py holds the per-timestep core of the vectorized engine, as kernels that
+work on the knowledge matrix directly.
+
+A kernel gets the knowledge matrix (or the matrix of agents that may not be called,
+which is computed from it) and the random numbers of the timestep, and returns the
+matching or updates the knowledge matrix in place. The kernels are grouped in
+backends, which are objects in a registry like the strategies and protocols:
+
+numpy -- The reference backend, in NumPy and Python.
+numba -- The same kernels, compiled with numba. Only available if numba is installed.
+
+All random numbers are drawn by the engine and passed to the kernels, so every
+backend makes the same calls for the same seed. Asking for a backend that is not
+available falls back to the NumPy backend.
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+NUMPY = 'numpy'
+NUMBA = 'numba'
+
+# Maps the name of every backend to its Backend object
+BACKENDS = {}
+
+
+def register_backend(backend_class):
+    """Class decorator that adds an object of backend_class to the registry, under its name."""
+    BACKENDS[backend_class.name] = backend_class()
+    return backend_class
+
+
+def get_backend(name=None):
+    """Returns the Backend object with this name.
+
+    If name is None, the fastest available backend is returned. If the backend is
+    not available, the NumPy backend is returned instead.
+    """
+    if name is None:
+        name = NUMBA if BACKENDS[NUMBA].available else NUMPY
+    if name not in BACKENDS:
+        raise ValueError(f"The kernel backend {name} does not exist")
+    if not BACKENDS[name].available:
+        return BACKENDS[NUMPY]
+    return BACKENDS[name]
+
+
+def pick(uniform, num_candidates):
+    """Returns the index of a candidate, out of num_candidates, for a uniform number in [0, 1)."""
+    return min(int(uniform * num_candidates), num_candidates - 1)
+
+
+class Backend:
+    """A set of kernels. Subclasses implement the kernels in their own way, but have to
+    give exactly the same results as the NumPy backend."""
+
+    name = None
+    available = True
+
+    def greedy_matching(self, ineligible, order, uniforms):
+        """Makes the matching for strategies that restrict which agents can be called.
+
+        The agents try to make a call in the given order. Every agent that has not
+        made a call yet picks a random agent out of the free agents it is allowed to
+        call, using the uniform number at its position in the order. An agent that
+        cannot call anyone can still be called by agents that come later.
+
+        Input arguments:
+        ineligible -- An n x n boolean matrix, True where the agent is not allowed
+            to call the other agent.
+        order -- A random permutation of the agent ids.
+        uniforms -- An array of n uniform numbers in [0, 1).
+
+        Output:
+        callers, callees -- Index arrays, callers[k] calls callees[k].
+        """
+        raise NotImplementedError
+
+    def exchange(self, knowledge, callers, callees, protocol):
+        """Updates the rows of all calls of a timestep in the knowledge matrix, in place,
+        like protocol.spread.
+
+        Input arguments:
+        knowledge -- The n x n boolean knowledge matrix.
+        callers, callees -- Index arrays, callers[k] called callees[k].
+        protocol -- The Protocol object of the call protocol.
+        """
+        protocol.spread(knowledge, callers, callees)
+
+
+@register_backend
+class NumpyBackend(Backend):
+    """The reference backend."""
+
+    name = NUMPY
+
+    def greedy_matching(self, ineligible, order, uniforms):
+        free = np.ones(len(order), dtype=bool)
+        callers = []
+        callees = []
+        for position, agent_calling in enumerate(order):
+            if not free[agent_calling]:
+                continue
+            free[agent_calling] = False
+            candidates = np.flatnonzero(free & ~ineligible[agent_calling])
+            if len(candidates) == 0:
+                free[agent_calling] = True
+                continue
+            connection_agent = candidates[pick(uniforms[position], len(candidates))]
+            free[connection_agent] = False
+            callers.append(agent_calling)
+            callees.append(connection_agent)
+        return np.array(callers, dtype=np.int64), np.array(callees, dtype=np.int64)
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def numba_greedy_matching(ineligible, order, uniforms):
+        """The loop of NumpyBackend.greedy_matching, compiled."""
+        num_agents = len(order)
+        free = np.ones(num_agents, dtype=np.bool_)
+        candidates = np.empty(num_agents, dtype=np.int64)
+        callers = np.empty(num_agents // 2, dtype=np.int64)
+        callees = np.empty(num_agents // 2, dtype=np.int64)
+        num_calls = 0
+        for position in range(num_agents):
+            agent_calling = order[position]
+            if not free[agent_calling]:
+                continue
+            free[agent_calling] = False
+            num_candidates = 0
+            for agent in range(num_agents):
+                if free[agent] and not ineligible[agent_calling, agent]:
+                    candidates[num_candidates] = agent
+                    num_candidates += 1
+            if num_candidates == 0:
+                free[agent_calling] = True
+                continue
+            connection_agent = candidates[min(int(uniforms[position] * num_candidates), num_candidates - 1)]
+            free[connection_agent] = False
+            callers[num_calls] = agent_calling
+            callees[num_calls] = connection_agent
+            num_calls += 1
+        return callers[:num_calls], callees[:num_calls]
+
+    @numba.njit(cache=True)
+    def numba_exchange(knowledge, callers, callees, caller_learns, callee_learns):
+        """Protocol.spread for a boolean knowledge matrix, compiled, without temporary arrays."""
+        for k in range(len(callers)):
+            caller = callers[k]
+            callee = callees[k]
+            for agent in range(knowledge.shape[1]):
+                known = knowledge[caller, agent] or knowledge[callee, agent]
+                if caller_learns:
+                    knowledge[caller, agent] = known
+                if callee_learns:
+                    knowledge[callee, agent] = known
+
+
+@register_backend
+class NumbaBackend(Backend):
+    """The kernels compiled with numba. They are compiled the first time they are called."""
+
+    name = NUMBA
+    available = numba is not None
+
+    def greedy_matching(self, ineligible, order, uniforms):
+        return numba_greedy_matching(ineligible, order, uniforms)
+
+    def exchange(self, knowledge, callers, callees, protocol):
+        numba_exchange(knowledge, callers, callees, protocol.caller_learns, protocol.callee_learns)
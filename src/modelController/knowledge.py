@@ -0,0 +1,122 @@
+"""knowledge.py stores what an agent knows about how many secrets the other agents know.
+
+For small populations the Model keeps these numbers in one dense n x n matrix, of
+which every agent holds a row. That matrix takes 8 * n ** 2 bytes before the
+simulation even starts, while early in a simulation (or on a sparse topology) an
+agent only knows about the few agents it has had calls with. A KnowledgeRow
+therefore stores the numbers of one agent sparsely, as a sorted array of agent
+ids and an array of the numbers of secrets they know. Once the row holds more
+than DENSE_FRACTION of the agents, it switches to a dense array by itself.
+
+An agent that is not in the row is taken to know 0 secrets, just like in the
+dense matrix, so both representations give the same simulation.
+
+Only secrets_known is stored sparsely. The secrets and connections of an agent
+stay dense integer bitmasks (see agent.py), which take n ** 2 / 16 bytes for
+the population from the start (about 156 MB at n = 50000) and n ** 2 / 8 bytes
+once the secrets have spread. That is at least 64 times less than the dense matrix, but
+it is not sparse, and it grows as the knowledge spreads.
+"""
+
+import numpy as np
+
+# A sparse row switches to a dense array once it holds more than this fraction of the agents
+DENSE_FRACTION = 0.25
+
+
+class KnowledgeRow:
+    """The number of secrets every agent knows, as far as one agent knows.
+
+    The row can be indexed like a numpy array with an agent id or an array of
+    agent ids, and an agent id can be assigned to.
+    """
+
+    __slots__ = ('num_agents', 'ids', 'counts', 'dense')
+
+    def __init__(self, num_agents):
+        """Initialises an empty (sparse) row for num_agents agents."""
+        self.num_agents = num_agents
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        # The dense array, None while the row is sparse
+        self.dense = None
+
+    def is_dense(self):
+        """Returns True if the row is stored as a dense array."""
+        return self.dense is not None
+
+    def make_dense(self):
+        """Switches the row to a dense array."""
+        self.dense = np.zeros(self.num_agents, dtype=int)
+        self.dense[self.ids] = self.counts
+        self.ids = self.counts = None
+
+    def check_density(self):
+        """Switches the row to a dense array if it holds too many agents to be sparse."""
+        if len(self.ids) > DENSE_FRACTION * self.num_agents:
+            self.make_dense()
+
+    def __getitem__(self, agent_ids):
+        """Returns the number of secrets of an agent, or an array of them for an array of agent ids."""
+        if self.dense is not None:
+            return self.dense[agent_ids]
+        agent_ids = np.asarray(agent_ids)
+        if len(self.ids) == 0:
+            return np.zeros(agent_ids.shape, dtype=int)[()]
+        positions = np.minimum(np.searchsorted(self.ids, agent_ids), len(self.ids) - 1)
+        return np.where(self.ids[positions] == agent_ids, self.counts[positions], 0)[()]
+
+    def __setitem__(self, agent_id, count):
+        """Sets the number of secrets of the agent with id agent_id."""
+        if self.dense is not None:
+            self.dense[agent_id] = count
+            return
+        position = np.searchsorted(self.ids, agent_id)
+        if position < len(self.ids) and self.ids[position] == agent_id:
+            self.counts[position] = count
+            return
+        self.ids = np.insert(self.ids, position, agent_id)
+        self.counts = np.insert(self.counts, position, count)
+        self.check_density()
+
+    def merge(self, other):
+        """Updates this row to the elementwise maximum of this row and the KnowledgeRow other."""
+        if self.dense is not None:
+            if other.dense is not None:
+                np.maximum(self.dense, other.dense, out=self.dense)
+            else:
+                self.dense[other.ids] = np.maximum(self.dense[other.ids], other.counts)
+            return
+        if other.dense is not None:
+            dense = other.dense.copy()
+            dense[self.ids] = np.maximum(dense[self.ids], self.counts)
+            self.dense = dense
+            self.ids = self.counts = None
+            return
+        ids, inverse = np.unique(np.concatenate([self.ids, other.ids]), return_inverse=True)
+        counts = np.zeros(len(ids), dtype=np.int64)
+        np.maximum.at(counts, inverse, np.concatenate([self.counts, other.counts]))
+        self.ids = ids
+        self.counts = counts
+        self.check_density()
+
+    def copy_from(self, other):
+        """Makes this row equal to the KnowledgeRow other, without sharing its arrays."""
+        if other.dense is not None:
+            if self.dense is not None:
+                self.dense[:] = other.dense
+            else:
+                self.dense = other.dense.copy()
+                self.ids = self.counts = None
+            return
+        self.dense = None
+        self.ids = other.ids.copy()
+        self.counts = other.counts.copy()
+
+    def to_array(self):
+        """Returns the row as a dense array."""
+        if self.dense is not None:
+            return self.dense.copy()
+        array = np.zeros(self.num_agents, dtype=int)
+        array[self.ids] = self.counts
+        return array
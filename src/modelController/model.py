@@ -1,349 +1,481 @@
-import random as rn
+import numpy as np
+from modelController.agent import Agent
+from modelController.knowledge import KnowledgeRow
+from modelController.protocols import STANDARD, get_protocol
+from modelController.schedules import get_schedule, pair_left_over
+from modelController.strategies import get_strategy
 
 class Model:
 
-    def __init__(self, strategy):
+    # The number of random agents choose_callable_agent tries before it builds the callable list
+    MAX_REJECTIONS = 8
+    # The number of last calls whose agents a Most-useful agent does not call while it
+    # is still learning secrets
+    RECENT_CALLS = 5
+    # From this number of agents on, the secrets_known of the agents are stored as
+    # KnowledgeRows, which are sparse until they fill up, instead of as one dense matrix
+    SPARSE_KNOWLEDGE_AGENTS = 4096
+
+    def __init__(self, strategy, rng=None, topology=None, protocol=STANDARD):
         """Initialises the controller.
 
         Input arguments:
         strategy -- The strategy the agents will use.
+        rng -- The seed or numpy.random.Generator all random choices are drawn from.
+        topology -- The Topology (see topology.py) the agents can call each other over,
+            None if every agent can call every other agent.
+        protocol -- The call protocol the agents will use, one of the keys of protocols.PROTOCOLS.
         """
+        self.rng = np.random.default_rng(rng)
         self.agents = []
         self.num_agents = 0
         self.connections = []
+        self.calls = []
+        self.topology = topology
+        self.set_strategy(strategy)
+        self.set_protocol(protocol)
+        # Bitmask with one bit set for every secret in the simulation
+        self.all_secrets = 0
+        # Row i holds the knowledge of agent i about how many secrets the other agents know,
+        # it is a matrix, or a list of KnowledgeRows if sparse_knowledge is True
+        self.secrets_known = np.zeros((0, 0), dtype=int)
+        self.sparse_knowledge = False
+        # The number of agents that know all secrets
+        self.num_experts = 0
+        self.reset_availability()
+
+    def set_strategy(self, strategy):
+        """Sets the strategy the agents will use, and looks up its Strategy object
+        in the registry of strategies.py, so the hooks of the strategy do not have
+        to be looked up during a simulation.
+        """
         self.strategy = strategy
-        self.all_secrets = set()
-
-    def make_callable_list(self, agent_calling, called_agents):
-        """Makes a list of callable agents, for an agent that is currently trying to
-        make a call.
+        self.strategy_plugin = get_strategy(strategy)
 
-        Input arguments:
-        agent_calling -- the agent trying to make a call, and who has to choose another agent
-        called_agents -- the set of agents that have already made a call this iteration, and
-            thus cannot be called by the currently calling agent
-        Output:
-            callable_agents -- The list of agents that can be called by this agent.
+    def set_protocol(self, protocol):
+        """Sets the call protocol the agents will use, and looks up its Protocol object
+        in the registry of protocols.py.
         """
-        callable_agents = self.agents.copy()
-        callable_agents.remove(agent_calling)
-        callable_agents = self.remove_agents_calling(callable_agents, called_agents)
-        if self.strategy == 'Call-Me-Once':
-            return self.remove_called_agents(callable_agents, agent_calling)
-        if self.strategy == 'Learn-New-Secrets':
-            return self.remove_agents_same_secrets(callable_agents, agent_calling)
-        return callable_agents
-
-    def remove_agents_calling(self, callable_agents, called_agents):
-        """Removes already calling agents from the callable agents list."""
-        for called_agent in called_agents:
-            if called_agent in callable_agents:
-                callable_agents.remove(called_agent)
-        return callable_agents
-
-    def remove_called_agents(self, callable_agents, agent_calling):
-        """Removes agents from the agent's 'already called list' (agent_calling.connections)
-        This is only used for the Call-Me-Once strategy
-
-        Input arguments: 
-        callable_agents -- The list of agents that can be called
-        agent_calling -- The agent that is currently trying to make a call
+        self.protocol = protocol
+        self.protocol_plugin = get_protocol(protocol)
 
-        Output:
-        callable_agents -- The list of agents that can be called, after the operation
-            of removing the already called agents from this list.
+    def init_agents(self):
+        """Re-initialises the agents list and fills it with num_agents agents.
+
+        The secrets_known of the agents are stored sparsely if the strategy does not
+        use them, or if there are at least SPARSE_KNOWLEDGE_AGENTS agents.
+        Some strategies cannot be used with every call protocol, see
+        Strategy.supports_protocol.
         """
-        for connected_agent in agent_calling.connections:
-            if connected_agent in callable_agents:
-                callable_agents.remove(connected_agent)
-        return callable_agents
+        if not self.strategy_plugin.supports_protocol(self.protocol_plugin):
+            raise ValueError(f"The strategy {self.strategy} cannot be used with the call protocol {self.protocol}")
+        if self.topology is not None:
+            if self.topology.num_agents != self.num_agents:
+                raise ValueError(f"The topology has {self.topology.num_agents} agents instead of {self.num_agents}")
+            if self.strategy_plugin.scheduled:
+                raise ValueError(f"The strategy {self.strategy} can only be used with every agent connected")
+        self.agents = []
+        self.sparse_knowledge = (not self.strategy_plugin.uses_secrets_known
+                                 or self.num_agents >= self.SPARSE_KNOWLEDGE_AGENTS)
+        if self.sparse_knowledge:
+            self.secrets_known = [KnowledgeRow(self.num_agents) for _ in range(self.num_agents)]
+        else:
+            self.secrets_known = np.zeros((self.num_agents, self.num_agents), dtype=int)
+        for i in range(self.num_agents):
+            self.agents.append(Agent(i, self.num_agents, self.secrets_known[i]))
+        self.all_secrets = (1 << self.num_agents) - 1
+        self.num_experts = sum(1 for agent in self.agents if agent.secrets == self.all_secrets)
 
-    def remove_agents_same_secrets(self, callable_agents, agent_calling):
-        """This function is only used in the Learn New Secrets strategy.
-        It removes agents from the callable list if the agent trying to make a call
-        already knows about their secrets.
+    def secret_counts(self):
+        """Returns a list with the number of secrets each agent knows."""
+        return [agent.num_secrets() for agent in self.agents]
 
-        Input arguments: 
-        callable_agents -- The list of agents that can be called
-        agent_calling -- The agent that is currently trying to make a call
+    def all_secrets_known(self):
+        """Returns True if every agent knows all secrets.
 
-        Output:
-        callable_agents -- The list of agents that can be called, after the operation
-            of removing the already called agents from this list.
+        The number of experts (agents that know all secrets) is kept up to date by
+        self.update_secrets, so this does not have to look at the agents.
         """
-        for other_agent in self.agents:
-            if f"Secret {other_agent.id}" in agent_calling.secrets:
-                if other_agent in callable_agents:
-                    callable_agents.remove(other_agent)
-        return callable_agents
+        return self.num_experts == self.num_agents
 
-    def determine_agent(self, agent_calling, callable_agents, timesteps_taken):
-        """This function chooses another agent for the agent_calling based on the strategy
-        the agents are using.
+    def update_secrets(self):
+        """Lets the agents that made a call this timestep switch to their next_secrets,
+        and counts the agents that became experts (know all secrets) by doing so.
 
-        For some strategies, there is a determine_agent_{strategy} function.
-        In case none of these strategies are being used. The chosen agent for
-        agent_calling is uniformly randomly picked from the list of callable agents.
+        Agents that did not make a call do not learn anything, so they are skipped.
+        """
+        for call in self.calls:
+            for agent in call:
+                was_expert = agent.secrets == self.all_secrets
+                agent.update_secrets()
+                if not was_expert and agent.secrets == self.all_secrets:
+                    self.num_experts += 1
+
+    def reset_availability(self):
+        """Makes all agents available to make or receive a call, at the start of a timestep.
+
+        The available agents are stored in four ways, which are kept in sync:
+        free_agents -- A list of the available agents, agents are removed from it by
+            swapping them with the last agent, so removing an agent costs O(1)
+        free_positions -- The index of every agent in free_agents, -1 if it is not available
+        free_mask -- A bitmask with the bits of the available agents set
+        free_array -- A boolean array that is True for the available agents
+        """
+        self.free_agents = self.agents.copy()
+        self.free_positions = list(range(self.num_agents))
+        self.free_mask = self.all_secrets
+        self.free_array = np.ones(self.num_agents, dtype=bool)
+
+    def is_free(self, agent):
+        """Returns True if the agent has not made or received a call this timestep."""
+        return self.free_positions[agent.id] >= 0
+
+    def mark_called(self, agent):
+        """Removes the agent from the available agents."""
+        position = self.free_positions[agent.id]
+        last_agent = self.free_agents.pop()
+        if last_agent is not agent:
+            self.free_agents[position] = last_agent
+            self.free_positions[last_agent.id] = position
+        self.free_positions[agent.id] = -1
+        self.free_mask &= ~(1 << agent.id)
+        self.free_array[agent.id] = False
+
+    def mark_free(self, agent):
+        """Adds the agent to the available agents again."""
+        self.free_positions[agent.id] = len(self.free_agents)
+        self.free_agents.append(agent)
+        self.free_mask |= 1 << agent.id
+        self.free_array[agent.id] = True
+
+    def free_neighbours(self, agent_calling):
+        """Returns an array with the ids of the available neighbours of agent_calling
+        in the topology, in O(degree)."""
+        neighbours = self.topology.neighbours(agent_calling.id)
+        return neighbours[self.free_array[neighbours]]
+
+    def ineligible_agents(self, agent_calling):
+        """Returns a bitmask of the agents agent_calling is not allowed to call because
+        of the strategy.
+
+        For example, Call-Me-Once agents cannot call agents they have called before
+        (agent_calling.connections), and Learn-New-Secrets agents cannot call agents
+        whose secret they already know.
+        """
+        return self.strategy_plugin.ineligible_agents(self, agent_calling)
 
-        Input arguments:
-        agent_calling -- The agent currently trying to call another agent.
-        callable_agents -- The list of agents that are callable for this agent.
-        timesteps_taken -- The number of timesteps the simulation is already underway.
-            This argument is passed to self.determine_agent_bubble and self.determine_agent_multiply
+    def make_callable_list(self, agent_calling):
+        """Makes a list of callable agents, for an agent that is currently trying to
+        make a call.
+
+        The agent_calling has already been removed from the available agents, so the
+        callable agents are the available agents (its available neighbours, if there
+        is a topology) that the strategy allows it to call.
 
+        Input arguments:
+        agent_calling -- the agent trying to make a call, and who has to choose another agent
         Output:
-        connection_agent -- The agent agent_calling will exchange secrets with.
+            callable_agents -- The list of agents that can be called by this agent.
         """
-        connection_agent = None
-        if self.strategy == 'Bubble':
-            self.determine_agent_bubble(agent_calling, timesteps_taken)
-        elif self.strategy == 'Mathematical':
-            self.determine_agent_multiply(agent_calling, callable_agents, timesteps_taken)
-        elif self.strategy == 'Min-Secrets':
-            self.determine_agent_min_secrets(agent_calling, callable_agents)
-        elif self.strategy == 'Max-Secrets':
-            self.determine_agent_max_secrets(agent_calling, callable_agents)
-        elif self.strategy == 'Most-useful':
-            self.determine_agent_balanced_secrets(agent_calling, callable_agents)
-        if connection_agent is None:
-            connection_agent = rn.choice(callable_agents)
-        return connection_agent
-
-    def determine_agent_bubble(self, agent_calling, timesteps_taken):
-        """Determines the agent agent_calling will exchange secrets with according
-        to the Bubble strategy.
+        ineligible = self.ineligible_agents(agent_calling)
+        if self.topology is not None:
+            return [self.agents[agent_id] for agent_id in self.free_neighbours(agent_calling).tolist()
+                    if not (ineligible >> agent_id) & 1]
+        if ineligible == 0:
+            return self.free_agents.copy()
+        return [agent for agent in self.free_agents if not (ineligible >> agent.id) & 1]
+
+    def choose_callable_agent(self, agent_calling):
+        """Picks a uniformly random agent out of the agents agent_calling can call,
+        without building the list of callable agents.
+
+        A random available agent is picked until it is one agent_calling is allowed
+        to call. Only if that fails MAX_REJECTIONS times, which can only happen when
+        few available agents can be called, the list of callable agents is built.
+        If there is a topology, the list of callable neighbours is always built,
+        which costs O(degree).
 
         Input arguments:
         agent_calling -- The agent currently trying to make a call
-        timesteps_taken -- The number of timesteps the simulation is already underway.
 
         Output:
-        connection_agent -- The agent agent_calling will have a connection with.
+        connection_agent -- The agent that is going to be called, or None if
+            agent_calling cannot call anyone.
         """
-        connection_agent = None
-        half_bubble = (2 ** timesteps_taken) / 2
-        next_step = agent_calling.id % (2 ** (timesteps_taken + 1))
-        if next_step <= half_bubble:
-            idx = agent_calling.id + (2 ** timesteps_taken)
-        else:
-            idx = agent_calling.id - (2 ** timesteps_taken)
-        if idx < len(self.agents):
-            connection_agent = self.agents[idx]
-        return connection_agent
-
-    def determine_agent_multiply(self, agent_calling, callable_agents, timesteps_taken):
-        """Determines the agent agent_calling will exchange secrets with according
-        to the Multiply strategy.
+        if self.topology is not None:
+            callable_agents = self.make_callable_list(agent_calling)
+            if not callable_agents:
+                return None
+            return callable_agents[self.rng.integers(len(callable_agents))]
+        num_free = len(self.free_agents)
+        if num_free == 0:
+            return None
+        ineligible = self.ineligible_agents(agent_calling)
+        if ineligible == 0:
+            return self.free_agents[self.rng.integers(num_free)]
+        if self.free_mask & ~ineligible == 0:
+            return None
+        for _ in range(self.MAX_REJECTIONS):
+            connection_agent = self.free_agents[self.rng.integers(num_free)]
+            if not (ineligible >> connection_agent.id) & 1:
+                return connection_agent
+        callable_agents = self.make_callable_list(agent_calling)
+        return callable_agents[self.rng.integers(len(callable_agents))]
+
+    def determine_agent(self, agent_calling, timesteps_taken):
+        """This function chooses another agent for the agent_calling based on the strategy
+        the agents are using.
 
-        The way the index of the connection_agent is calculated:
-        idx = (agent_calling.id + 1) * (timesteps_taken + 2) - 1
-        If it turns out that there is no agent with this id in the callable list,
-        The index will be incremented and the process repeats. If idx > self.num_agents,
-        the idx is reset to 0.
+        The choice is made by the choose_partner hook of the strategy. Some strategies
+        use a determine_agent_{strategy} function, the others pick the agent
+        uniformly at random from the callable agents.
+        The Bubble and Mathematical strategies do not use this function, their calls
+        are replayed from a schedule by self.exchange_scheduled_secrets.
 
         Input arguments:
-        agent_calling -- The agent currently trying to make a call
-        callable_agents -- The list of agents agent_calling can call.
+        agent_calling -- The agent currently trying to call another agent.
         timesteps_taken -- The number of timesteps the simulation is already underway.
 
         Output:
-        connection_agent -- The agent agent_calling will have a connection with.
+        connection_agent -- The agent agent_calling will exchange secrets with, or None
+            if there are no agents agent_calling can call.
         """
-        idx = (agent_calling.id + 1) * (timesteps_taken + 2) - 1
-        return self.solve_multiply(idx % self.num_agents, callable_agents)
+        return self.strategy_plugin.choose_partner(self, agent_calling, timesteps_taken)
 
-    def find_agent_in_callable(self, callable_agents, idx):
-        """Checks whether there is an agent in the callable_agents list that has
-        the ID that was calculated using the Multiply strategy.
+    def determine_agent_by_secrets_known(self, agent_calling, lowest, excluded_agents=()):
+        """Chooses the available agent that knows the lowest (or highest) number of
+        secrets, as far as agent_calling knows.
 
-        If there is an agent whose ID is equal to the calculated ID,
-        this agent will be the agent the agent_calling (in determine_agent_multiply)
-        will exchange secrets with.
+        The secrets_known row of agent_calling is masked with the available agents
+        (or its available neighbours, if there is a topology) and the minimum (or
+        maximum) is taken in one vectorized operation. If several agents are tied,
+        one of them is picked uniformly at random.
 
         Input arguments:
-        callable_agents -- The list of callable agents for the agent currently trying
-            to make a call
-        idx -- The calculated index (according to the Multiply strategy)"""
-        for agent in callable_agents:
-            if agent.id == idx:
-                return True
-        return False
-
-    def solve_multiply(self, idx, callable_agents):
-        """Calls the find_agent_in_callable function, which checks whether the
-        calculated index belongs to an agent in the callable_agents list.
-
-        If this is the case, this agent is returned as the connection_agent, which
-        will exchange secrets with the agent_calling. If this is not the case,
-        the process repeats with an incremented index.
+        agent_calling -- The agent currently trying to make a call
+        lowest -- If True, the agent with the lowest number is chosen, otherwise
+            the agent with the highest number.
+        excluded_agents -- Agents that may not be chosen, even if they are available.
 
-        Input arguments:
-        idx -- The calculated index according to the multiply strategy.
-        callable_agents -- The list of agents that can currently be called by the
-            agent trying to make a call.
+        Output:
+        connection_agent -- The agent that the agent_calling will exchange secrets with,
+            or None if there are no available agents.
         """
-        if self.find_agent_in_callable(callable_agents, idx):
-            return self.agents[idx]
-        return self.solve_multiply((idx + 1) % self.num_agents, callable_agents)
-
-    def determine_agent_min_secrets(self, agent_calling, callable_agents):
+        if self.topology is not None:
+            candidates = self.free_neighbours(agent_calling)
+        else:
+            candidates = np.flatnonzero(self.free_array)
+        if excluded_agents:
+            candidates = candidates[~np.isin(candidates, [agent.id for agent in excluded_agents])]
+        if len(candidates) == 0:
+            return None
+        secrets_known = agent_calling.secrets_known[candidates]
+        best = secrets_known.min() if lowest else secrets_known.max()
+        best_candidates = candidates[secrets_known == best]
+        return self.agents[best_candidates[self.rng.integers(len(best_candidates))]]
+
+    def determine_agent_min_secrets(self, agent_calling):
         """Determines the connection_agent according to the Min Secrets strategy.
 
         The strategy determines the connection agent by looking at the secrets_known
         array that each agent has. This array stores information about other agents,
         namely the number of secrets they all know. The agent_calling will call the
-        agent from callable_agents that knows the lowest number of secrets (as far
+        available agent that knows the lowest number of secrets (as far
         as the agent_calling knows)
 
         Input arguments:
         agent_calling -- The agent currently trying to make a call
-        callable_agents -- The list of agents agent_calling can call.
 
         Output:
         connection_agent -- The agent that the agent_calling will exchange secrets with.
         """
-        connection_agent = None
-        min_known = self.num_agents + 1
-        for callable_agent in callable_agents:
-            if agent_calling.secrets_known[callable_agent.id] < min_known:
-                connection_agent = callable_agent
-                min_known = agent_calling.secrets_known[callable_agent.id]
-        return connection_agent
-
-    def determine_agent_max_secrets(self, agent_calling, callable_agents):
+        return self.determine_agent_by_secrets_known(agent_calling, lowest=True)
+
+    def determine_agent_max_secrets(self, agent_calling):
         """Determines the connection_agent according to the Max Secrets strategy.
 
         The strategy determines the connection agent by looking at the secrets_known
         array that each agent has. This array stores information about other agents,
         namely the number of secrets they all know. The agent_calling will call the
-        agent from callable_agents that knows the highest number of secrets (as far
+        available agent that knows the highest number of secrets (as far
         as the agent_calling knows)
 
         Input arguments:
         agent_calling -- The agent currently trying to make a call
-        callable_agents -- The list of agents agent_calling can call.
 
         Output:
         connection_agent -- The agent that the agent_calling will exchange secrets with.
         """
-        connection_agent = None
-        max_known = 0
-        for callable_agent in callable_agents:
-            if agent_calling.secrets_known[callable_agent.id] > max_known:
-                connection_agent = callable_agent
-                max_known = agent_calling.secrets_known[callable_agent.id]
-        return connection_agent
-
-    def determine_agent_balanced_secrets(self, agent_calling, callable_agents):
+        return self.determine_agent_by_secrets_known(agent_calling, lowest=False)
+
+    def determine_agent_balanced_secrets(self, agent_calling):
         """Determines the connection_agent according to the Balanced Secrets strategy.
 
         The agent_calling will essentially use the Max Secrets strategy, until it knows
         all the secrets. It will then use the Min Secrets strategy.
+        While using the Max Secrets strategy, it does not call the agents it had its last
+        RECENT_CALLS calls with. Otherwise two agents that know the most secrets of each
+        other keep calling each other, and the simulation never finishes.
 
         Input arguments:
         agent_calling -- The agent currently trying to make a call
-        callable_agents -- The list of agents agent_calling can call.
 
         Output:
         connection_agent -- The agent that the agent_calling will exchange secrets with.
         """
-        if len(agent_calling.secrets) == self.num_agents:
-            return self.determine_agent_min_secrets(agent_calling, callable_agents)
-        return self.determine_agent_max_secrets(agent_calling, callable_agents)
-
-    def add_called_agents(self, agent_calling, connection_agent, called_agents):
-        """Adds the currently calling agents agent_calling and connection_agent to the
-        called_agents set. It also updates the 'called' list of both agents.
-    
+        if agent_calling.secrets == self.all_secrets:
+            return self.determine_agent_min_secrets(agent_calling)
+        return self.determine_agent_by_secrets_known(
+            agent_calling, lowest=False, excluded_agents=agent_calling.called[-self.RECENT_CALLS:])
+
+    def add_called_agents(self, agent_calling, connection_agent):
+        """Removes the connection_agent from the available agents, so it cannot be
+        called again during this timestep. The agent_calling was already removed.
+        It also updates the 'called' list of both agents.
+
         Input arguments:
         agent_calling -- The agent that made a call
         connection_agent -- The agent that was called by agent_calling
-        called_agents -- The set of agents that were called or have made a call
-            This set of called agents is subtracted from the list of callable agents later.
-            Every timestep, the called_agents set resets.
-
-        Output: called_agents -- The set of called agents which cannot be called again
-            during this timestep.
         """
-        called_agents.add(agent_calling)
-        called_agents.add(connection_agent)
+        self.mark_called(connection_agent)
         agent_calling.called.append(connection_agent)
         connection_agent.called.append(agent_calling)
-        return called_agents
 
-    def agents_interact(self, agent_calling, connection_agent):
-        """Updates the incoming secrets of both the agent_calling and connection_agent.
+    def agents_interact(self, agent_calling, connection_agents):
+        """Sets the next secrets of the agents in a call, according to the call protocol.
 
-        The incoming secrets is used so that each agent's secrets information is not updated
+        The next secrets are used so that each agent's secrets information is not updated
         until the end of the iteration. Otherwise the program's sequential nature would
-        cause errors. This function also updates the 'secrets_known' arrays of both agents.
-        This array is used in the Min Secrets, Max Secrets and Balanced Secrets strategies,
-        and it allows each agent to keep track of how many secrets each other agent has.
-        The agents will also communicate these numbers between each other.
+        cause errors. The 'secrets_known' arrays of the agents are updated for all calls
+        at once at the end of the timestep, by self.share_secrets_known.
 
         Input arguments:
-        agent_calling -- The agent currently trying to make a call
-        connection_agent -- The agent that is going to be called
+        agent_calling -- The agent that made the call
+        connection_agents -- The list of agents that agent_calling called, this is
+            one agent unless the protocol has conference calls
         """
-        agent_calling.incoming_secrets.update(connection_agent.secrets)
-        connection_agent.incoming_secrets.update(agent_calling.secrets)
-        agent_calling.update_secrets_known(connection_agent.secrets_known)
-        connection_agent.update_secrets_known(agent_calling.secrets_known)
-        if "Token" in self.strategy:
-            agent_calling.give_token(connection_agent)
-        if "Spider" in self.strategy:
-            connection_agent.give_token(agent_calling)
+        self.protocol_plugin.exchange(agent_calling, connection_agents)
+        self.calls.append([agent_calling] + connection_agents)
 
-    def exchange_secrets(self, timesteps_taken):
-        """Exchange secrets between agents in the self.agents list.
+    def share_secrets_known(self):
+        """Lets the agents of every call of this timestep share their 'secrets_known'
+        arrays, according to the call protocol.
 
-        Initialises a set named 'called', which keeps track of which
-        agents have already exchanged secrets this time-step.
-        Then it shuffles the list of agents so each time-step will not
-        start with the same agent. This shuffling ensures fairness.
-        For each agent in the list of agents, the 'callable_agents' list is computed.
-        This 'callable_agents' list will consist of the list of agents, minus the
-        agents that are not eligible to be called in this time-step (for
-        this particular agent). If the 'callable_agents' list still contains
-        agents after pruning it, a random agent will be chosen from this list
-        to exchange secrets with.
+        This array is used in the Min Secrets, Max Secrets and Balanced Secrets strategies,
+        and it allows each agent to keep track of how many secrets each other agent has.
+        After a (push-pull) call, both agents know the elementwise maximum of their arrays.
+        Doing this at the end of the timestep gives the same result as doing it during the
+        call, because an agent does not choose another agent anymore after it made a call.
+        Strategies that do not use the arrays skip this. If all calls are between two
+        agents and the arrays are rows of the shared secrets_known matrix, all calls are
+        done in one batched operation, otherwise they are done one call at a time.
         """
-        shuffled_agents = self.agents.copy()
-        # Connections will store the connections between agents this timestep
-        self.connections = []
-        called = set()
+        if not self.calls or not self.strategy_plugin.uses_secrets_known:
+            return
+        if self.sparse_knowledge or self.protocol_plugin.call_size > 2:
+            for agent_calling, *connection_agents in self.calls:
+                self.protocol_plugin.share_secrets_known(agent_calling, connection_agents)
+            return
+        pairs = np.array([(agent_calling.id, connection_agent.id) for agent_calling, connection_agent in self.calls])
+        self.protocol_plugin.spread(self.secrets_known, pairs[:, 0], pairs[:, 1])
+
+    def make_call(self, agent_calling, connection_agent):
+        """Lets agent_calling call connection_agent, which has to be available.
+
+        This does the bookkeeping of the call, the secrets are exchanged by
+        self.agents_interact, once all agents of the call are known.
+        Afterwards the after_call hook of the strategy is called, with Token and Spider
+        it passes on the token.
 
+        Input arguments:
+        agent_calling -- The agent that makes the call, it was already removed from
+            the available agents
+        connection_agent -- The agent that is called
+        """
+        self.add_called_agents(agent_calling, connection_agent)
+        self.strategy_plugin.after_call(agent_calling, connection_agent)
+
+        # The connection is stored for both agents,
+        # so they wont call each other again if the strategy is CMO
+        agent_calling.store_connections(connection_agent)
+        connection_agent.store_connections(agent_calling)
+
+        # Add the connection in the controller,
+        # so we can highlight it in the UI
+        self.connections.append(
+            (min(agent_calling.id, connection_agent.id), max(agent_calling.id, connection_agent.id)))
+
+    def exchange_scheduled_secrets(self, timesteps_taken):
+        """Exchange secrets between agents according to the schedule of the Bubble or
+        Mathematical strategy.
+
+        The scheduled calls of this timestep were computed once for this number of
+        agents (see schedules.py), so they only have to be replayed. The agents that
+        are not in a scheduled call call a random agent out of each other.
+        """
+        callers, callees, left_over = get_schedule(self.strategy, self.num_agents).matching(timesteps_taken)
+        random_callers, random_callees = pair_left_over(left_over, self.rng)
+        for caller, callee in zip(callers.tolist() + random_callers.tolist(),
+                                  callees.tolist() + random_callees.tolist()):
+            agent = self.agents[caller]
+            connection_agent = self.agents[callee]
+            self.mark_called(agent)
+            self.make_call(agent, connection_agent)
+            self.agents_interact(agent, [connection_agent])
+
+    def exchange_chosen_secrets(self, timesteps_taken):
+        """Exchange secrets between agents that choose who they call one after the other.
+
+        The list of agents is shuffled so each time-step will not start with the same
+        agent. This shuffling ensures fairness.
+        Each available agent removes itself from the available agents and chooses
+        an agent to call out of the available agents that are eligible to be called
+        in this time-step (for this particular agent). If there is no such agent,
+        the agent becomes available again, so it can still be called by others.
+        With conference calls, the agent goes on to choose more agents in the same
+        way, until the call is full or there is no eligible agent left.
+        """
+        shuffled_agents = self.agents.copy()
         # We shuffle the agents to fairly determine who goes first
-        rn.shuffle(shuffled_agents)
+        self.rng.shuffle(shuffled_agents)
         for agent in shuffled_agents:
-            # If the agent is already in the called set, we skip it
-            if agent in called or agent.has_token is False:
+            # If the agent already made or received a call, we skip it
+            if not self.is_free(agent) or agent.has_token is False:
                 continue
 
-            callable_agents = self.make_callable_list(agent, called)
-
-            # Only try to call if there are agents to call
-            if len(callable_agents) > 0:
-                rn.shuffle(callable_agents)
-                connection_agent = self.determine_agent(
-                    agent, callable_agents, timesteps_taken)
+            self.mark_called(agent)
+            connection_agent = self.determine_agent(agent, timesteps_taken)
 
-                if connection_agent in called:
-                    continue
+            if connection_agent is None or not self.is_free(connection_agent):
+                self.mark_free(agent)
+                continue
 
-                called = self.add_called_agents(
-                    agent, connection_agent, called)
-                self.agents_interact(agent, connection_agent)
+            self.make_call(agent, connection_agent)
+            connection_agents = [connection_agent]
+            while len(connection_agents) + 1 < self.protocol_plugin.call_size:
+                connection_agent = self.determine_agent(agent, timesteps_taken)
+                if connection_agent is None or not self.is_free(connection_agent):
+                    break
+                self.make_call(agent, connection_agent)
+                connection_agents.append(connection_agent)
+            self.agents_interact(agent, connection_agents)
 
-                # The connection is stored for both agents,
-                # so they wont call each other again if the strategy is CMO
-                agent.store_connections(connection_agent)
-                connection_agent.store_connections(agent)
+    def exchange_secrets(self, timesteps_taken):
+        """Exchange secrets between agents in the self.agents list.
 
-                # Add the connection in the controller,
-                # so we can highlight it in the UI
-                self.connections.append(
-                    (min(agent.id, connection_agent.id), max(agent.id, connection_agent.id)))
+        Makes all agents available, which keeps track of which agents have
+        not exchanged secrets yet this time-step. Then the calls of this time-step
+        are made, and all agents learn the secrets of their calls at once.
+        """
+        # Connections will store the connections between agents this timestep,
+        # and calls the agents in every call, the caller first
+        self.connections = []
+        self.calls = []
+        self.reset_availability()
+        if self.strategy_plugin.scheduled:
+            self.exchange_scheduled_secrets(timesteps_taken)
+        else:
+            self.exchange_chosen_secrets(timesteps_taken)
 
-        for agent in self.agents:
-            agent.update_secrets()
+        self.share_secrets_known()
+        self.update_secrets()
@@ -0,0 +1,183 @@
+"""profiling.py measures where the time of a simulation goes.
+
+Profiling is opt-in. A Controller that is given a SimulationStats object calls
+instrument on its model, which replaces the methods of the phases of a time-step,
+on that model object only, by wrappers that time and count them. A model that is
+not instrumented runs its own methods, so profiling costs nothing when it is off.
+
+The times of the phases are inclusive: a phase that is called inside another
+phase (make_callable_list inside determine_agent, for example) counts for both.
+"""
+
+import functools
+import json
+import sys
+import time
+import tracemalloc
+
+# The methods of the models that are timed, if the model has them
+PHASES = ('exchange_secrets', 'make_matching', 'determine_agent', 'choose_callable_agent',
+          'make_callable_list', 'make_call', 'agents_interact', 'share_secrets_known', 'update_secrets')
+
+
+class SimulationStats:
+    """The cumulative timers and counters of profiled simulations.
+
+    timers -- Maps every phase to the total time spent in it, in seconds.
+    phase_calls -- Maps every phase to the number of times it was called.
+    counters -- The number of time-steps, the number of calls made, and the number of
+        times an agent found no agent to call (no_partner). The last one is only
+        counted for the engines that choose the agents one by one. There is no counter
+        of agents that chose an agent that was already in a call, because the agents
+        only choose out of the available agents (see Model.choose_callable_agent).
+    blocks -- Maps every phase to the net number of memory blocks it allocated,
+        only if allocations are tracked.
+    peak_bytes -- The most memory allocated during one time-step, only if
+        allocations are tracked.
+    """
+
+    def __init__(self, track_allocations=False):
+        """Initialises empty stats.
+
+        Input arguments:
+        track_allocations -- If True, the memory allocations are tracked as well,
+            which makes the simulations a lot slower.
+        """
+        self.track_allocations = track_allocations
+        self.timers = {}
+        self.phase_calls = {}
+        self.counters = {'timesteps': 0, 'calls': 0, 'no_partner': 0}
+        self.blocks = {}
+        self.peak_bytes = 0
+
+    def add_phase(self, phase, seconds, blocks=0):
+        """Adds one call of a phase, that took seconds and allocated blocks memory blocks."""
+        self.timers[phase] = self.timers.get(phase, 0.0) + seconds
+        self.phase_calls[phase] = self.phase_calls.get(phase, 0) + 1
+        if self.track_allocations:
+            self.blocks[phase] = self.blocks.get(phase, 0) + blocks
+
+    def merge(self, other):
+        """Adds the timers and counters of the SimulationStats other to these stats."""
+        for phase, seconds in other.timers.items():
+            self.timers[phase] = self.timers.get(phase, 0.0) + seconds
+        for phase, calls in other.phase_calls.items():
+            self.phase_calls[phase] = self.phase_calls.get(phase, 0) + calls
+        for name, count in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + count
+        for phase, blocks in other.blocks.items():
+            self.blocks[phase] = self.blocks.get(phase, 0) + blocks
+        self.peak_bytes = max(self.peak_bytes, other.peak_bytes)
+
+    def to_dict(self):
+        """Returns the stats as a dictionary, which can be saved as JSON."""
+        return {
+            'track_allocations': self.track_allocations,
+            'timers': self.timers,
+            'phase_calls': self.phase_calls,
+            'counters': self.counters,
+            'blocks': self.blocks,
+            'peak_bytes': self.peak_bytes,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Returns the SimulationStats of a dictionary made by to_dict."""
+        stats = cls(data['track_allocations'])
+        stats.timers = dict(data['timers'])
+        stats.phase_calls = dict(data['phase_calls'])
+        stats.counters = dict(data['counters'])
+        stats.blocks = dict(data['blocks'])
+        stats.peak_bytes = data['peak_bytes']
+        return stats
+
+    def save(self, filename):
+        """Saves the stats as a JSON file."""
+        with open(filename, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def summary(self):
+        """Returns a table of the phases, the slowest first, and the counters, as a string."""
+        lines = [f"{'Phase':<22}{'Seconds':>12}{'Calls':>12}{'Per call (us)':>16}"]
+        for phase, seconds in sorted(self.timers.items(), key=lambda item: -item[1]):
+            calls = self.phase_calls[phase]
+            lines.append(f"{phase:<22}{seconds:>12.4f}{calls:>12}{1e6 * seconds / calls:>16.2f}")
+        lines.append(', '.join(f"{name}: {count}" for name, count in self.counters.items()))
+        if self.track_allocations:
+            lines.append(', '.join(f"{phase}: {blocks}" for phase, blocks in self.blocks.items()))
+            lines.append(f"peak_bytes: {self.peak_bytes}")
+        return '\n'.join(lines)
+
+
+def timed_phase(stats, phase, method):
+    """Returns a wrapper of method that adds the time it takes to the phase in stats."""
+    if stats.track_allocations:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            blocks = sys.getallocatedblocks()
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            stats.add_phase(phase, time.perf_counter() - start, sys.getallocatedblocks() - blocks)
+            return result
+    else:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(*args, **kwargs)
+            stats.add_phase(phase, time.perf_counter() - start)
+            return result
+    return wrapper
+
+
+def instrument(model, stats):
+    """Replaces the methods of the phases of model by wrappers that add their times,
+    and the counters, to stats.
+
+    Input arguments:
+    model -- A Model or VectorizedModel
+    stats -- The SimulationStats the measurements are added to
+    """
+    for phase in PHASES:
+        if hasattr(model, phase):
+            setattr(model, phase, timed_phase(stats, phase, getattr(model, phase)))
+
+    timed_exchange_secrets = model.exchange_secrets
+    # Model keeps the agents of every call in calls, the other engines only have connections
+    has_calls = hasattr(model, 'calls')
+
+    def exchange_secrets(timesteps_taken):
+        if stats.track_allocations:
+            traced_exchange_secrets(timesteps_taken)
+        else:
+            timed_exchange_secrets(timesteps_taken)
+        stats.counters['timesteps'] += 1
+        # A conference call has a connection for every called agent, but it is one call
+        stats.counters['calls'] += len(model.calls) if has_calls else len(model.connections)
+
+    def traced_exchange_secrets(timesteps_taken):
+        # The allocations are only traced during the time-step, so the overhead of
+        # tracemalloc stops with the profiled simulation. If something else is already
+        # tracing, it is left running.
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+        try:
+            current = tracemalloc.get_traced_memory()[0]
+            timed_exchange_secrets(timesteps_taken)
+            stats.peak_bytes = max(stats.peak_bytes, tracemalloc.get_traced_memory()[1] - current)
+        finally:
+            if started:
+                tracemalloc.stop()
+    model.exchange_secrets = exchange_secrets
+
+    if hasattr(model, 'determine_agent'):
+        timed_determine_agent = model.determine_agent
+
+        def determine_agent(agent_calling, timesteps_taken):
+            connection_agent = timed_determine_agent(agent_calling, timesteps_taken)
+            if connection_agent is None:
+                stats.counters['no_partner'] += 1
+            return connection_agent
+        model.determine_agent = determine_agent
@@ -0,0 +1,147 @@
+"""protocols.py defines the call protocols, which decide who learns what in a call.
+
+Standard -- Push-pull, both agents learn each other's secrets.
+Push -- Only the called agent learns the secrets of the caller.
+Pull -- Only the caller learns the secrets of the called agent.
+Conference -- The caller calls up to CONFERENCE_SIZE - 1 agents at once, and all
+    agents in the call learn each other's secrets.
+
+Like the strategies, the protocols are objects in a registry, looked up once when
+the protocol of a Model is set. Every protocol has a per-call path for Model and,
+if it only has calls between two agents, a batched path that updates the rows of
+all calls of a timestep in a matrix at once.
+"""
+
+import numpy as np
+
+STANDARD = 'Standard'
+
+# The maximum number of agents in a conference call, including the caller
+CONFERENCE_SIZE = 3
+
+# Maps the name of every protocol to its Protocol object
+PROTOCOLS = {}
+
+
+def register_protocol(protocol_class):
+    """Class decorator that adds an object of protocol_class to the registry, under its name."""
+    PROTOCOLS[protocol_class.name] = protocol_class()
+    return protocol_class
+
+
+def get_protocol(name):
+    """Returns the Protocol object of the call protocol with this name."""
+    if name not in PROTOCOLS:
+        raise ValueError(f"The call protocol {name} does not exist")
+    return PROTOCOLS[name]
+
+
+class Protocol:
+    """A call protocol. By default every agent in a call learns all secrets of the call,
+    as with the Standard (push-pull) protocol.
+
+    Subclasses override the methods in which their protocol differs.
+    """
+
+    name = None
+    # The maximum number of agents in a call, including the caller
+    call_size = 2
+    # Whether the caller learns the secrets of the called agents, and the other way around
+    caller_learns = True
+    callee_learns = True
+
+    def exchange(self, agent_calling, connection_agents):
+        """Sets the next_secrets of all agents in a call, to the secrets they will know
+        after the time-step.
+
+        The next_secrets are assigned, not merged into, so every call only computes
+        the secrets of the call once and nothing is left over from earlier calls.
+
+        Input arguments:
+        agent_calling -- The agent that made the call
+        connection_agents -- The list of agents that agent_calling called
+        """
+        secrets = agent_calling.secrets
+        for agent in connection_agents:
+            secrets |= agent.secrets
+        agent_calling.next_secrets = secrets
+        for agent in connection_agents:
+            agent.next_secrets = secrets
+
+    def share_secrets_known(self, agent_calling, connection_agents):
+        """Lets the agents in a call share their secrets_known, like their secrets."""
+        for agent in connection_agents:
+            agent_calling.update_secrets_known(agent.secrets_known)
+        for agent in connection_agents:
+            agent.update_secrets_known(agent_calling.secrets_known)
+
+    def spread(self, matrix, callers, callees):
+        """Updates the rows of all calls between two agents at once, in a knowledge
+        (boolean) or secrets_known (integer) matrix.
+
+        The agents in the calls have to be all different. The elementwise maximum
+        is the union for boolean rows.
+
+        Input arguments:
+        matrix -- The matrix, its rows are indexed by callers and callees
+        callers, callees -- Indices of the rows, callers[k] called callees[k]. These
+            can be arrays, or tuples of arrays for matrices with more dimensions.
+        """
+        merged = np.maximum(matrix[callers], matrix[callees])
+        if self.caller_learns:
+            matrix[callers] = merged
+        if self.callee_learns:
+            matrix[callees] = merged
+
+
+@register_protocol
+class StandardProtocol(Protocol):
+    """Push-pull, both agents learn each other's secrets."""
+
+    name = STANDARD
+
+
+@register_protocol
+class PushProtocol(Protocol):
+    """Only the called agents learn the secrets of the caller."""
+
+    name = 'Push'
+    caller_learns = False
+
+    def exchange(self, agent_calling, connection_agents):
+        agent_calling.next_secrets = agent_calling.secrets
+        for agent in connection_agents:
+            agent.next_secrets = agent.secrets | agent_calling.secrets
+
+    def share_secrets_known(self, agent_calling, connection_agents):
+        for agent in connection_agents:
+            agent.update_secrets_known(agent_calling.secrets_known)
+
+
+@register_protocol
+class PullProtocol(Protocol):
+    """Only the caller learns the secrets of the called agents."""
+
+    name = 'Pull'
+    callee_learns = False
+
+    def exchange(self, agent_calling, connection_agents):
+        secrets = agent_calling.secrets
+        for agent in connection_agents:
+            secrets |= agent.secrets
+            agent.next_secrets = agent.secrets
+        agent_calling.next_secrets = secrets
+
+    def share_secrets_known(self, agent_calling, connection_agents):
+        for agent in connection_agents:
+            agent_calling.update_secrets_known(agent.secrets_known)
+
+
+@register_protocol
+class ConferenceProtocol(Protocol):
+    """The caller calls up to CONFERENCE_SIZE - 1 agents at once, and they all learn
+    all secrets of the call."""
+
+    name = 'Conference'
+    call_size = CONFERENCE_SIZE
+
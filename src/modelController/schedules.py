@@ -0,0 +1,136 @@
+"""schedules.py precomputes the calls of the deterministic strategies.
+
+With the Bubble and Mathematical strategies, every agent computes the id of the
+agent it wants to call from its own id and the timestep. The calls therefore do
+not depend on anything that happens during a simulation, so for every number of
+agents the matching of every timestep is computed once, cached, and replayed by
+every simulation. Only the agents that do not fit into the schedule (with Bubble,
+the agents that do not fit into a bubble) call a random available agent.
+"""
+
+import numpy as np
+
+SCHEDULED_STRATEGIES = ('Bubble', 'Mathematical')
+
+# Maps (strategy, num_agents) to the Schedule of that strategy
+_schedules = {}
+
+
+def bubble_targets(num_agents, timestep):
+    """Returns the ids of the agents every agent wants to call with the Bubble strategy.
+
+    The agents call the agent with their id plus (or minus) 2 ** timestep, which
+    results in bubbles of 2 ** timestep agents that know each other's secrets.
+    The targets of agents that do not fit in a bubble are outside 0 .. num_agents - 1.
+    """
+    # The ids become too large for numpy integers after some timesteps, so Python ints are used
+    step = 2 ** timestep
+    return [agent_id + step if 2 * (agent_id % (2 * step)) <= step else agent_id - step
+            for agent_id in range(num_agents)]
+
+
+def multiply_targets(num_agents, timestep):
+    """Returns the ids of the agents every agent wants to call with the Mathematical strategy.
+
+    The id is calculated as (id + 1) * (timestep + 2) - 1, modulo the number of agents.
+    """
+    ids = np.arange(num_agents)
+    return ((ids + 1) * (timestep + 2) - 1) % num_agents
+
+
+def make_matching(targets):
+    """Makes the scheduled part of the matching of one timestep, out of the agents every
+    agent wants to call.
+
+    The agents call in the order of their id. If the agent an agent wants to call
+    is not available, the next id is tried, and so on, until an available agent is
+    found. This probing is a loop, so it works for any number of agents.
+    Agents whose target does not exist (it is outside 0 .. num_agents - 1) do not
+    call anyone here. They are left over, and call a random available agent when
+    the schedule is replayed.
+
+    Input arguments:
+    targets -- The id of the agent every agent wants to call.
+
+    Output:
+    callers, callees -- Index arrays, callers[k] calls callees[k].
+    left_over -- Index array of the agents that are not in a call.
+    """
+    num_agents = len(targets)
+    free = [True] * num_agents
+    callers = []
+    callees = []
+    for agent_calling in range(num_agents):
+        target = int(targets[agent_calling])
+        if not free[agent_calling] or not 0 <= target < num_agents:
+            continue
+        free[agent_calling] = False
+        for offset in range(num_agents):
+            connection_agent = (target + offset) % num_agents
+            if free[connection_agent]:
+                free[connection_agent] = False
+                callers.append(agent_calling)
+                callees.append(connection_agent)
+                break
+        else:
+            free[agent_calling] = True
+    left_over = [agent for agent in range(num_agents) if free[agent]]
+    return np.array(callers, dtype=int), np.array(callees, dtype=int), np.array(left_over, dtype=int)
+
+
+def pair_left_over(left_over, rng):
+    """Pairs up the left over agents of a scheduled matching at random.
+
+    Every left over agent calls a random left over agent, which is the same as
+    pairing up consecutive agents of a random permutation.
+
+    Input arguments:
+    left_over -- Index array of the agents that are not in a scheduled call.
+    rng -- The numpy.random.Generator to draw the permutation from.
+
+    Output:
+    callers, callees -- Index arrays, callers[k] calls callees[k].
+    """
+    order = rng.permutation(left_over)
+    pairs = order[:len(order) - len(order) % 2].reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+class Schedule:
+    """The matchings of every timestep of a deterministic strategy, for one number of agents.
+
+    The matchings are computed when they are first needed and are kept afterwards.
+    """
+
+    def __init__(self, strategy, num_agents):
+        """Initialises an empty schedule.
+
+        Input arguments:
+        strategy -- One of the SCHEDULED_STRATEGIES
+        num_agents -- The number of agents in the simulation
+        """
+        if strategy not in SCHEDULED_STRATEGIES:
+            raise ValueError(f"The strategy {strategy} does not have a schedule")
+        self.strategy = strategy
+        self.num_agents = num_agents
+        self.matchings = []
+
+    def targets(self, timestep):
+        """Returns the id of the agent every agent wants to call during timestep."""
+        if self.strategy == 'Bubble':
+            return bubble_targets(self.num_agents, timestep)
+        return multiply_targets(self.num_agents, timestep)
+
+    def matching(self, timestep):
+        """Returns the scheduled matching of timestep as index arrays (callers, callees, left_over)."""
+        while len(self.matchings) <= timestep:
+            self.matchings.append(make_matching(self.targets(len(self.matchings))))
+        return self.matchings[timestep]
+
+
+def get_schedule(strategy, num_agents):
+    """Returns the cached Schedule of the strategy for num_agents agents."""
+    key = (strategy, num_agents)
+    if key not in _schedules:
+        _schedules[key] = Schedule(strategy, num_agents)
+    return _schedules[key]
@@ -0,0 +1,202 @@
+"""strategies.py defines the strategies the agents can use, as plugins.
+
+A strategy is a Strategy object with separate hooks for the three places a
+strategy changes the simulation of Model:
+ineligible_agents -- Which available agents an agent is not allowed to call.
+choose_partner -- Which agent an agent calls.
+after_call -- What happens after two agents made a call.
+The strategy objects are kept in a registry under their name. A Model looks up
+its strategy once, when the strategy is set, instead of comparing the name on
+every call.
+
+A strategy can also declare how the fast engines (VectorizedModel and BatchModel)
+make its matching, by setting batched_matching. Strategies that leave it None can
+only be simulated by Model.
+"""
+
+# Maps the name of every strategy to its Strategy object
+STRATEGIES = {}
+
+
+def register_strategy(strategy_class):
+    """Class decorator that adds an object of strategy_class to the registry, under its name."""
+    STRATEGIES[strategy_class.name] = strategy_class()
+    return strategy_class
+
+
+def get_strategy(name):
+    """Returns the Strategy object of the strategy with this name."""
+    if name not in STRATEGIES:
+        raise ValueError(f"The strategy {name} does not exist")
+    return STRATEGIES[name]
+
+
+class Strategy:
+    """The default strategy: every agent calls a uniformly random available agent.
+
+    Subclasses override the hooks in which their strategy differs.
+    """
+
+    name = None
+    # True if the calls are replayed from a schedule (see schedules.py), the hooks
+    # below are then not used
+    scheduled = False
+    # How the fast engines make the matching of this strategy: 'random', 'greedy'
+    # or 'scheduled'. None if the fast engines cannot simulate this strategy.
+    batched_matching = None
+    # True if the fast engines have to keep track of which agents called each other
+    uses_connections = False
+    # True if the agents choose whom to call by how many secrets the other agents know,
+    # only then the agents share their secrets_known after a call
+    uses_secrets_known = False
+    # True if only agents with a token can make a call, and after_call passes the
+    # token on. A token is passed on between two agents, so these strategies cannot
+    # be used with conference calls
+    uses_tokens = False
+
+    def supports_protocol(self, protocol):
+        """Returns True if the strategy can be used with the Protocol object protocol.
+
+        The scheduled strategies always have calls between two agents, and the callers
+        of a schedule are picked in the order of their ids, so with a one-way protocol
+        (Push or Pull) the same agents would never learn anything. The strategies that
+        pass on tokens can only pass a token on to one agent.
+        """
+        if self.scheduled:
+            return protocol.call_size == 2 and protocol.caller_learns and protocol.callee_learns
+        return protocol.call_size == 2 or not self.uses_tokens
+
+    def ineligible_agents(self, model, agent_calling):
+        """Returns a bitmask of the agents agent_calling is not allowed to call."""
+        return 0
+
+    def choose_partner(self, model, agent_calling, timesteps_taken):
+        """Returns the agent agent_calling calls, or None if it cannot call anyone.
+
+        agent_calling was already removed from the available agents of the model.
+        """
+        return model.choose_callable_agent(agent_calling)
+
+    def after_call(self, agent_calling, connection_agent):
+        """Is called after agent_calling has called connection_agent."""
+
+    def ineligible_matrix(self, knowledge, connected):
+        """Returns the boolean array the fast engines use to make a greedy matching.
+
+        The array is indexed like knowledge (by agent, or by run and agent), and is
+        True where the agent is not allowed to call the other agent.
+        """
+        raise NotImplementedError(f"The strategy {self.name} does not have a greedy matching")
+
+
+@register_strategy
+class RandomStrategy(Strategy):
+    """Every agent calls a uniformly random available agent."""
+
+    name = 'Random'
+    batched_matching = 'random'
+
+
+@register_strategy
+class CallMeOnceStrategy(Strategy):
+    """Agents cannot call agents they have had a call with before."""
+
+    name = 'Call-Me-Once'
+    batched_matching = 'greedy'
+    uses_connections = True
+
+    def ineligible_agents(self, model, agent_calling):
+        return agent_calling.connections
+
+    def ineligible_matrix(self, knowledge, connected):
+        return connected
+
+
+@register_strategy
+class LearnNewSecretsStrategy(Strategy):
+    """Agents only call agents whose secret they do not know yet."""
+
+    name = 'Learn-New-Secrets'
+    batched_matching = 'greedy'
+
+    def ineligible_agents(self, model, agent_calling):
+        return agent_calling.secrets
+
+    def ineligible_matrix(self, knowledge, connected):
+        return knowledge
+
+
+@register_strategy
+class MinSecretsStrategy(Strategy):
+    """Agents call the available agent that knows the fewest secrets, as far as they know."""
+
+    name = 'Min-Secrets'
+    uses_secrets_known = True
+
+    def choose_partner(self, model, agent_calling, timesteps_taken):
+        return model.determine_agent_min_secrets(agent_calling)
+
+
+@register_strategy
+class MaxSecretsStrategy(Strategy):
+    """Agents call the available agent that knows the most secrets, as far as they know."""
+
+    name = 'Max-Secrets'
+    uses_secrets_known = True
+
+    def choose_partner(self, model, agent_calling, timesteps_taken):
+        return model.determine_agent_max_secrets(agent_calling)
+
+
+@register_strategy
+class MostUsefulStrategy(Strategy):
+    """Agents use Max-Secrets until they know all secrets, and Min-Secrets afterwards."""
+
+    name = 'Most-useful'
+    uses_secrets_known = True
+
+    def choose_partner(self, model, agent_calling, timesteps_taken):
+        return model.determine_agent_balanced_secrets(agent_calling)
+
+
+@register_strategy
+class TokenStrategy(Strategy):
+    """Only agents with a token can make a call, and they give their token to the agent they call."""
+
+    name = 'Token'
+    uses_tokens = True
+
+    def after_call(self, agent_calling, connection_agent):
+        agent_calling.give_token(connection_agent)
+
+
+@register_strategy
+class SpiderStrategy(Strategy):
+    """Only agents with a token can make a call, and they take the token of the agent they call."""
+
+    name = 'Spider'
+    uses_tokens = True
+
+    def after_call(self, agent_calling, connection_agent):
+        connection_agent.give_token(agent_calling)
+
+
+class ScheduledStrategy(Strategy):
+    """A strategy whose calls are replayed from a schedule, see schedules.py."""
+
+    scheduled = True
+    batched_matching = 'scheduled'
+
+
+@register_strategy
+class BubbleStrategy(ScheduledStrategy):
+    """Agents call the agent 2 ** timestep ids away, so they form growing bubbles."""
+
+    name = 'Bubble'
+
+
+@register_strategy
+class MathematicalStrategy(ScheduledStrategy):
+    """Agents call the agent with id (id + 1) * (timestep + 2) - 1, modulo the number of agents."""
+
+    name = 'Mathematical'
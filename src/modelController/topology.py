@@ -0,0 +1,157 @@
+"""topology.py defines the communication networks the agents can gossip over.
+
+By default every agent can call every other agent (the complete graph). A
+Topology restricts the calls of every agent to its neighbours. The neighbours
+are stored in compressed sparse row (CSR) form: the neighbours of agent i are
+indices[indptr[i]:indptr[i + 1]], so looking them up costs O(degree) and the
+whole network only takes O(n + number of edges) memory.
+
+The complete graph itself is not stored as a Topology, it is represented by None.
+"""
+
+import numpy as np
+
+COMPLETE = 'Complete'
+
+
+class Topology:
+    """An undirected communication network in CSR form."""
+
+    def __init__(self, num_agents, indptr, indices):
+        """Initialises the topology.
+
+        Input arguments:
+        num_agents -- The number of agents in the network
+        indptr -- Array of length num_agents + 1, the neighbours of agent i are
+            indices[indptr[i]:indptr[i + 1]]
+        indices -- The sorted neighbours of every agent, one agent after the other
+        """
+        self.num_agents = num_agents
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_edges(cls, num_agents, edges):
+        """Makes a topology out of a list (or array) of edges (i, j).
+
+        Both directions of every edge are stored, and self-loops and duplicate
+        edges are removed.
+        """
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        edges = edges[edges[:, 0] != edges[:, 1]]
+        sources = np.concatenate([edges[:, 0], edges[:, 1]])
+        targets = np.concatenate([edges[:, 1], edges[:, 0]])
+        # Sort the edges by source and then by target, and drop the duplicates
+        keys = np.unique(sources * num_agents + targets)
+        sources, targets = keys // num_agents, keys % num_agents
+        indptr = np.zeros(num_agents + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=num_agents), out=indptr[1:])
+        return cls(num_agents, indptr, targets)
+
+    def neighbours(self, agent_id):
+        """Returns the array of the ids of the neighbours of the agent, without copying it."""
+        return self.indices[self.indptr[agent_id]:self.indptr[agent_id + 1]]
+
+    def degrees(self):
+        """Returns an array with the number of neighbours of every agent."""
+        return np.diff(self.indptr)
+
+    def is_neighbour(self, agent_id, other_id):
+        """Returns True if the agents are neighbours, in O(log degree)."""
+        neighbours = self.neighbours(agent_id)
+        position = np.searchsorted(neighbours, other_id)
+        return position < len(neighbours) and neighbours[position] == other_id
+
+    def edges(self):
+        """Returns an array with every edge (i, j), i < j, once."""
+        sources = np.repeat(np.arange(self.num_agents), self.degrees())
+        upper = sources < self.indices
+        return np.stack([sources[upper], self.indices[upper]], axis=1)
+
+
+def ring_topology(num_agents, rng, neighbours=1):
+    """Makes a ring, every agent is connected to the neighbours closest agents on both sides."""
+    ids = np.arange(num_agents)
+    edges = [np.stack([ids, (ids + offset) % num_agents], axis=1) for offset in range(1, neighbours + 1)]
+    return Topology.from_edges(num_agents, np.concatenate(edges))
+
+
+def grid_topology(num_agents, rng, columns=None):
+    """Makes a grid, every agent is connected to the agents above, below, left and right of it.
+
+    The agents fill the grid row by row, so the last row can be incomplete. If columns
+    is None, the grid is as square as possible.
+    """
+    if columns is None:
+        columns = max(1, int(np.ceil(np.sqrt(num_agents))))
+    ids = np.arange(num_agents)
+    right = ids[(ids % columns != columns - 1) & (ids + 1 < num_agents)]
+    below = ids[ids + columns < num_agents]
+    edges = np.concatenate([np.stack([right, right + 1], axis=1),
+                            np.stack([below, below + columns], axis=1)])
+    return Topology.from_edges(num_agents, edges)
+
+
+def erdos_renyi_topology(num_agents, rng, probability):
+    """Makes an Erdős–Rényi random graph, every pair of agents is connected with the given probability.
+
+    The number of edges is drawn first, after which that many distinct random edges
+    are drawn, so the cost does not grow with the number of pairs of agents.
+    Note that the graph is not always connected, then the simulation cannot finish.
+    """
+    num_pairs = num_agents * (num_agents - 1) // 2
+    num_edges = rng.binomial(num_pairs, probability)
+    keys = np.zeros(0, dtype=np.int64)
+    while len(keys) < num_edges:
+        pairs = rng.integers(num_agents, size=(num_edges - len(keys), 2))
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        pairs.sort(axis=1)
+        keys = np.union1d(keys, pairs[:, 0] * num_agents + pairs[:, 1])
+    # Drop a random surplus, np.union1d sorts the keys
+    keys = rng.permutation(keys)[:num_edges]
+    return Topology.from_edges(num_agents, np.stack([keys // num_agents, keys % num_agents], axis=1))
+
+
+def scale_free_topology(num_agents, rng, edges_per_agent=2):
+    """Makes a scale-free Barabási–Albert graph.
+
+    The agents are added one after the other, and every new agent is connected to
+    edges_per_agent distinct earlier agents, chosen with a probability proportional
+    to their degree.
+    """
+    edges = []
+    targets = list(range(edges_per_agent))
+    # Every agent occurs once for every edge it has, so a uniform choice from this
+    # list is a choice proportional to the degree
+    repeated_agents = []
+    for agent_id in range(edges_per_agent, num_agents):
+        edges.extend((agent_id, target) for target in targets)
+        repeated_agents.extend(targets)
+        repeated_agents.extend([agent_id] * edges_per_agent)
+        new_targets = set()
+        while len(new_targets) < edges_per_agent:
+            new_targets.add(repeated_agents[rng.integers(len(repeated_agents))])
+        targets = list(new_targets)
+    return Topology.from_edges(num_agents, edges)
+
+
+# Maps the name of every topology to the function that makes it. Every function
+# takes the number of agents, a numpy.random.Generator and the topology parameters.
+TOPOLOGIES = {
+    'Ring': ring_topology,
+    'Grid': grid_topology,
+    'Erdos-Renyi': erdos_renyi_topology,
+    'Scale-free': scale_free_topology,
+}
+
+
+def make_topology(name, num_agents, rng, **params):
+    """Makes the topology called name for num_agents agents.
+
+    Returns None for the complete graph (COMPLETE), which is not stored.
+    """
+    if name == COMPLETE:
+        return None
+    if name not in TOPOLOGIES:
+        raise ValueError(f"The topology {name} does not exist")
+    return TOPOLOGIES[name](num_agents, rng, **params)
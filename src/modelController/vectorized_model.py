@@ -0,0 +1,156 @@
+import numpy as np
+from modelController.kernels import get_backend
+from modelController.schedules import get_schedule, pair_left_over
+from modelController.protocols import STANDARD, get_protocol
+from modelController.strategies import get_strategy
+
+
+class VectorizedModel:
+    """A simulation engine that represents the whole population as matrices.
+
+    Instead of Agent objects, the knowledge of all agents is stored in an n x n
+    boolean matrix: knowledge[i, j] is True if agent i knows the secret of agent j.
+    Every timestep the calls are built as a matching, stored in two index arrays
+    (callers and callees), and all secrets are exchanged in one batched operation.
+
+    Only the strategies that declare a batched_matching (see strategies.py), and the
+    call protocols with calls between two agents, can be simulated by this engine.
+    """
+
+    def __init__(self, strategy, rng=None, protocol=STANDARD, backend=None):
+        """Initialises the model.
+
+        Input arguments:
+        strategy -- The strategy the agents will use.
+        rng -- The seed or numpy.random.Generator all random choices are drawn from.
+        protocol -- The call protocol the agents will use.
+        backend -- The name of the kernel backend, the fastest available one if None.
+        """
+        self.rng = np.random.default_rng(rng)
+        self.backend = get_backend(backend)
+        self.num_agents = 0
+        self.connections = []
+        self.set_strategy(strategy)
+        self.set_protocol(protocol)
+        self.knowledge = np.zeros((0, 0), dtype=bool)
+        # connected[i, j] is True if agents i and j have called each other (Call-Me-Once)
+        self.connected = np.zeros((0, 0), dtype=bool)
+        # experts[i] is True if agent i knows all secrets, num_experts is the number of them
+        self.experts = np.zeros(0, dtype=bool)
+        self.num_experts = 0
+
+    def set_strategy(self, strategy):
+        """Sets the strategy the agents will use, and looks up its Strategy object."""
+        self.strategy = strategy
+        self.strategy_plugin = get_strategy(strategy)
+
+    def set_protocol(self, protocol):
+        """Sets the call protocol the agents will use, and looks up its Protocol object."""
+        self.protocol = protocol
+        self.protocol_plugin = get_protocol(protocol)
+
+    def init_agents(self):
+        """Re-initialises the knowledge matrix, so every agent only knows its own secret."""
+        if self.strategy_plugin.batched_matching is None:
+            raise ValueError(f"The strategy {self.strategy} is not supported by the vectorized engine")
+        if self.protocol_plugin.call_size > 2:
+            raise ValueError(f"The call protocol {self.protocol} is not supported by the vectorized engine")
+        if not self.strategy_plugin.supports_protocol(self.protocol_plugin):
+            raise ValueError(f"The strategy {self.strategy} cannot be used with the call protocol {self.protocol}")
+        self.knowledge = np.eye(self.num_agents, dtype=bool)
+        self.connected = np.zeros((self.num_agents, self.num_agents), dtype=bool)
+        self.experts = self.knowledge.all(axis=1)
+        self.num_experts = int(self.experts.sum())
+
+    def secret_counts(self):
+        """Returns an array with the number of secrets each agent knows."""
+        return self.knowledge.sum(axis=1)
+
+    def all_secrets_known(self):
+        """Returns True if every agent knows all secrets.
+
+        The number of experts (agents that know all secrets) is kept up to date by
+        self.exchange_secrets, so this does not have to look at the knowledge matrix.
+        """
+        return self.num_experts == self.num_agents
+
+    def make_random_matching(self, order):
+        """Makes the matching for the Random strategy.
+
+        Letting the agents call a uniformly random free agent in a random order
+        results in a uniformly random (near-)perfect matching, so the matching is
+        made by pairing up consecutive agents of a random permutation.
+
+        Input arguments:
+        order -- A random permutation of the agent ids.
+
+        Output:
+        callers, callees -- Index arrays, callers[k] calls callees[k].
+        """
+        pairs = order[:self.num_agents - self.num_agents % 2].reshape(-1, 2)
+        return pairs[:, 0], pairs[:, 1]
+
+    def make_greedy_matching(self, order):
+        """Makes the matching for strategies that restrict which agents can be called.
+
+        The agents try to make a call in the given order. Every agent that has not
+        made a call yet picks a uniformly random agent out of the free agents it is
+        allowed to call, just like Model.exchange_secrets does, see
+        Backend.greedy_matching. The knowledge matrix does not change while the
+        matching is made, so the agents that may not be called are computed once.
+
+        Input arguments:
+        order -- A random permutation of the agent ids.
+
+        Output:
+        callers, callees -- Index arrays, callers[k] calls callees[k].
+        """
+        ineligible = self.strategy_plugin.ineligible_matrix(self.knowledge, self.connected)
+        return self.backend.greedy_matching(ineligible, order, self.rng.random(self.num_agents))
+
+    def make_scheduled_matching(self, timesteps_taken):
+        """Makes the matching for the Bubble and Mathematical strategies, out of the
+        scheduled calls of this timestep and random calls between the left over agents.
+
+        Output:
+        callers, callees -- Index arrays, callers[k] calls callees[k].
+        """
+        callers, callees, left_over = get_schedule(self.strategy, self.num_agents).matching(timesteps_taken)
+        random_callers, random_callees = pair_left_over(left_over, self.rng)
+        return np.concatenate([callers, random_callers]), np.concatenate([callees, random_callees])
+
+    def make_matching(self, timesteps_taken):
+        """Makes the matching of agents that call each other this timestep.
+
+        Output:
+        callers, callees -- Index arrays, callers[k] calls callees[k].
+        """
+        batched_matching = self.strategy_plugin.batched_matching
+        if batched_matching == 'scheduled':
+            return self.make_scheduled_matching(timesteps_taken)
+        order = self.rng.permutation(self.num_agents)
+        if batched_matching == 'random':
+            return self.make_random_matching(order)
+        return self.make_greedy_matching(order)
+
+    def exchange_secrets(self, timesteps_taken):
+        """Exchanges the secrets of all the agents that call each other this timestep.
+
+        Because the agents in a matching are all different, the rows of the agents
+        in all calls can be updated in one batched operation by the call protocol (with
+        push-pull, both rows are replaced by their union), which is the same as updating
+        all agents at the end of the timestep.
+        Only the agents in a call can become experts, so only their rows are checked.
+        """
+        callers, callees = self.make_matching(timesteps_taken)
+        self.backend.exchange(self.knowledge, callers, callees, self.protocol_plugin)
+        for agents in (callers, callees):
+            new_experts = self.knowledge[agents].all(axis=1)
+            self.num_experts += int(new_experts.sum() - self.experts[agents].sum())
+            self.experts[agents] = new_experts
+        self.connected[callers, callees] = True
+        self.connected[callees, callers] = True
+
+        # Store the connections, so they can be highlighted in the UI
+        self.connections = list(zip(np.minimum(callers, callees).tolist(),
+                                    np.maximum(callers, callees).tolist()))
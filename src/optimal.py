@@ -0,0 +1,130 @@
+"""optimal.py computes the optimal number of time-steps of the gossip problem.
+
+In every time-step each agent can be in at most one call, so the calls of a
+time-step form a matching of the complete graph. The optimal number of
+time-steps for n agents is known in closed form: ceil(log2(n)) if n is even,
+and ceil(log2(n)) + 1 if n is odd (and larger than 1). For small n the optimum
+is found by searching over the matchings instead, which agrees with the closed form.
+"""
+
+import math
+
+# Up to this number of agents, optimal_timesteps searches for the optimum
+MAX_SEARCH_AGENTS = 10
+
+# Maps num_agents to the optimal number of time-steps
+_optimal_timesteps = {}
+
+
+def closed_form_timesteps(num_agents):
+    """Returns the known optimal number of time-steps for num_agents agents."""
+    if num_agents <= 1:
+        return 0
+    rounds = math.ceil(math.log2(num_agents))
+    if num_agents % 2 == 1:
+        rounds += 1
+    return rounds
+
+
+def steps_to_double(count, num_agents):
+    """Returns the number of time-steps it takes to grow count to num_agents, if it
+    can at most double every time-step."""
+    steps = 0
+    while count < num_agents:
+        count *= 2
+        steps += 1
+    return steps
+
+
+def lower_bound(state, num_agents):
+    """Returns a lower bound of the number of time-steps needed from state.
+
+    The number of secrets an agent knows, and the number of agents that know a
+    secret, can at most double in a time-step.
+    """
+    fewest_secrets = min(bin(secrets).count("1") for secrets in state)
+    fewest_holders = min(sum((secrets >> i) & 1 for secrets in state) for i in range(num_agents))
+    return steps_to_double(min(fewest_secrets, fewest_holders), num_agents)
+
+
+def next_states(state):
+    """Yields the states after one time-step from state, one for every maximal matching.
+
+    A state is the sorted tuple of the secrets bitmasks of the agents. Which agent
+    knows which secrets does not matter, only which sets of secrets are known, so
+    agents with the same secrets are interchangeable. Agents with the same secrets
+    are therefore only tried once as the partner of an agent. Only maximal matchings
+    are tried, because an extra call never makes the agents know less.
+    """
+    def extend(remaining, merged, left_over):
+        if len(remaining) <= 1:
+            if len(remaining) + left_over <= 1:
+                yield tuple(sorted(merged + remaining))
+            return
+        first, rest = remaining[0], remaining[1:]
+        tried = set()
+        for i, partner in enumerate(rest):
+            if partner in tried:
+                continue
+            tried.add(partner)
+            union = first | partner
+            yield from extend(rest[:i] + rest[i + 1:], merged + [union, union], left_over)
+        # With an odd number of agents, one agent is not in a call
+        if left_over == 0 and len(remaining) % 2 == 1:
+            yield from extend(rest, merged + [first], 1)
+
+    yield from extend(list(state), [], 0)
+
+
+def search_timesteps(num_agents):
+    """Returns the optimal number of time-steps for num_agents agents, by an iterative
+    deepening search over the matchings of every time-step.
+
+    The states that cannot be finished within a number of time-steps are memoized,
+    so every state is only expanded once for every number of time-steps.
+    """
+    if num_agents <= 1:
+        return 0
+    all_secrets = (1 << num_agents) - 1
+    # Maps a state to the highest number of time-steps it cannot be finished in
+    unsolvable = {}
+
+    def solvable(state, timesteps):
+        if all(secrets == all_secrets for secrets in state):
+            return True
+        if timesteps < lower_bound(state, num_agents) or unsolvable.get(state, -1) >= timesteps:
+            return False
+        for next_state in next_states(state):
+            if solvable(next_state, timesteps - 1):
+                return True
+        unsolvable[state] = timesteps
+        return False
+
+    start = tuple(1 << i for i in range(num_agents))
+    timesteps = lower_bound(start, num_agents)
+    while not solvable(start, timesteps):
+        timesteps += 1
+    return timesteps
+
+
+def optimal_timesteps(num_agents):
+    """Returns the optimal number of time-steps for num_agents agents.
+
+    For at most MAX_SEARCH_AGENTS agents it is searched for, otherwise the closed
+    form is used. The results are cached.
+    """
+    if num_agents not in _optimal_timesteps:
+        if num_agents <= MAX_SEARCH_AGENTS:
+            _optimal_timesteps[num_agents] = search_timesteps(num_agents)
+        else:
+            _optimal_timesteps[num_agents] = closed_form_timesteps(num_agents)
+    return _optimal_timesteps[num_agents]
+
+
+def ratio_to_optimal(timesteps, num_agents):
+    """Returns timesteps divided by the optimal number of time-steps for num_agents
+    agents, or None if the optimum is 0."""
+    optimum = optimal_timesteps(num_agents)
+    if optimum == 0:
+        return None
+    return timesteps / optimum
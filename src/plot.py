@@ -1,6 +1,8 @@
 import numpy as np 
 import matplotlib.pyplot as plt
 import pandas as pd
+from aggregates import AggregateStore
+from optimal import optimal_timesteps
 
 limit0 = 100000
 limit1 = 100000
@@ -10,7 +12,21 @@ limit3 = 100000
 
 n = np.array([10, 50, 100, 500])
 strategies = np.array(["Tau opt", "Random", "Call Me Once", "Learn New Secrets", "Token", "Spider", "Token improved", "Spider improved", "Math", "Bubble", "Call Min Secrets", "Call Max Secrets", "Call Best Secrets"])
-values = np.array([[4, 6, 7, 9],[5.47, 9.13, 10.37, 13.09], [5.50, 9.13, 10.37, 13.11], [5.43, 9.14, 10.36, 13.09],[18.76, 95.35, 183.01, None], [18.96, 100.19, 182.54, None], [11.63, 31.28, 42.77, 680.78], [13.29, 35.65, 47.69, 702.72], [5.56, 9.25, 10.59, 13.36], [5.38, 8.91, 10.1, 12.81], [4.89, 8.58, 10.07, 13.03], [45.05, 902.46, None, None], [5.59, 12.02, 14.94, 21.56]])
+values = np.array([[optimal_timesteps(num_agents) for num_agents in n],[5.47, 9.13, 10.37, 13.09], [5.50, 9.13, 10.37, 13.11], [5.43, 9.14, 10.36, 13.09],[18.76, 95.35, 183.01, None], [18.96, 100.19, 182.54, None], [11.63, 31.28, 42.77, 680.78], [13.29, 35.65, 47.69, 702.72], [5.56, 9.25, 10.59, 13.36], [5.38, 8.91, 10.1, 12.81], [4.89, 8.58, 10.07, 13.03], [45.05, 902.46, None, None], [5.59, 12.02, 14.94, 21.56]])
+
+# If there are aggregated simulation results, plot those instead of the values of the paper
+store = AggregateStore.for_results("data/timesteps_data")
+if store.stats:
+    result_strategies = sorted({strategy for strategy, _, _ in store.stats})
+    result_values = [values[0]]
+    for strategy in result_strategies:
+        strategy_values = []
+        for num_agents in n:
+            stats = store.get(strategy, num_agents, "Standard") or store.get(strategy, num_agents)
+            strategy_values.append(None if stats is None else round(stats.mean, 2))
+        result_values.append(strategy_values)
+    strategies = np.array(["Tau opt"] + result_strategies)
+    values = np.array(result_values, dtype=object)
 
 forbidden = []
 
@@ -0,0 +1,157 @@
+"""results.py stores the raw results of the simulations.
+
+The results are split up in partitions, one csv file per combination of strategy
+and number of agents, inside a results directory:
+
+    {results_dir}/{strategy}/{num_agents}_agents.csv
+
+New results are only ever appended to the end of these files, so saving results
+never rewrites what was saved before. Reading results only opens the partitions
+that a query needs.
+
+Every simulation has its own numpy.random.SeedSequence. Its entropy and spawn key
+are stored with the result (in the Seed and Spawn Key columns), so any single
+simulation can be reproduced with simulations.replay_run. Partitions that were
+made before these columns existed keep their own columns.
+"""
+
+import csv
+import os
+import os.path
+import pandas as pd
+
+COLUMNS = ['Num Simulations', 'Num Agents', 'Strategy', 'Call Protocol', 'Timesteps Taken', 'Seed', 'Spawn Key']
+
+
+# The end of the filename of every partition
+PARTITION_SUFFIX = "_agents.csv"
+
+
+def partition_path(results_dir, strategy, num_agents):
+    """Returns the path of the csv file with the results of a strategy and number of agents."""
+    return os.path.join(results_dir, strategy, f"{num_agents}{PARTITION_SUFFIX}")
+
+
+def format_spawn_key(spawn_key):
+    """Returns the spawn key of a SeedSequence as a string, like '3 17'."""
+    return ' '.join(str(key) for key in spawn_key)
+
+
+def parse_spawn_key(spawn_key):
+    """Returns the spawn key tuple of a string made by format_spawn_key."""
+    return tuple(int(key) for key in str(spawn_key).split())
+
+
+class ResultsWriter:
+    """Appends the results of simulations to the partitions of a results directory.
+
+    The rows are buffered and written in chunks of chunk_size rows. The writer
+    can be used as a context manager, which flushes the remaining rows on exit.
+    If the block exits with an exception, the buffered rows are dropped instead,
+    because the aggregate store is not saved for them either.
+    """
+
+    def __init__(self, results_dir, chunk_size=1000):
+        """Initialises the writer.
+
+        Input arguments:
+        results_dir -- The directory the partitions are stored in
+        chunk_size -- The number of buffered rows after which they are written to disk
+        """
+        self.results_dir = results_dir
+        self.chunk_size = chunk_size
+        # Maps a partition path to the list of rows that still have to be written to it
+        self.buffers = {}
+        self.num_buffered = 0
+
+    def add(self, num_sim, num_agents, strategy, timesteps_taken, call_protocol=None, seed_sequence=None):
+        """Adds the result of one simulation."""
+        seed_sequences = None if seed_sequence is None else [seed_sequence]
+        self.add_many(num_sim, num_agents, strategy, [timesteps_taken], call_protocol, seed_sequences)
+
+    def add_many(self, num_sim, num_agents, strategy, timesteps_taken, call_protocol=None, seed_sequences=None):
+        """Adds the results of a list of simulations with the same settings.
+
+        Input arguments:
+        num_sim -- The number of simulations of the configuration
+        num_agents -- The number of agents in the simulations
+        strategy -- The strategy the agents used
+        timesteps_taken -- The list of timesteps each simulation took
+        call_protocol -- The call protocol the agents used
+        seed_sequences -- The list of the SeedSequence of each simulation, None if
+            they are not known
+        """
+        rows = self.buffers.setdefault(partition_path(self.results_dir, strategy, num_agents), [])
+        if seed_sequences is None:
+            seed_sequences = [None] * len(timesteps_taken)
+        for timesteps, seed_sequence in zip(timesteps_taken, seed_sequences):
+            if seed_sequence is None:
+                seed, spawn_key = None, None
+            else:
+                seed, spawn_key = seed_sequence.entropy, format_spawn_key(seed_sequence.spawn_key)
+            rows.append([num_sim, num_agents, strategy, call_protocol, timesteps, seed, spawn_key])
+        self.num_buffered += len(timesteps_taken)
+        if self.num_buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Appends all buffered rows to their partitions.
+
+        The rows are cut to the columns of the partition, so results are still
+        appended correctly to partitions made before the seed columns existed.
+        """
+        for path, rows in self.buffers.items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            num_columns = len(COLUMNS)
+            if os.path.exists(path):
+                with open(path, newline='') as csv_file:
+                    num_columns = len(next(csv.reader(csv_file), COLUMNS))
+            new_file = not os.path.exists(path)
+            with open(path, 'a', newline='') as csv_file:
+                writer = csv.writer(csv_file)
+                if new_file:
+                    writer.writerow(COLUMNS)
+                writer.writerows(row[:num_columns] for row in rows)
+        self.buffers = {}
+        self.num_buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+
+def read_results(results_dir, strategies=None, num_agents_values=None):
+    """Reads the results of the given strategies and numbers of agents into a DataFrame.
+
+    Only the partitions that match the query are read, other files in the results
+    directory are skipped.
+
+    Input arguments:
+    results_dir -- The directory the partitions are stored in
+    strategies -- The strategies to read, None for all strategies
+    num_agents_values -- The numbers of agents to read, None for all numbers of agents
+
+    Output:
+    df -- A pandas DataFrame with the columns in COLUMNS
+    """
+    if strategies is None:
+        strategies = sorted(os.listdir(results_dir)) if os.path.isdir(results_dir) else []
+        strategies = [strategy for strategy in strategies
+                      if os.path.isdir(os.path.join(results_dir, strategy))]
+
+    frames = []
+    for strategy in strategies:
+        strategy_dir = os.path.join(results_dir, strategy)
+        if num_agents_values is None:
+            paths = [os.path.join(strategy_dir, filename) for filename in sorted(os.listdir(strategy_dir))
+                     if filename.endswith(PARTITION_SUFFIX)] if os.path.isdir(strategy_dir) else []
+        else:
+            paths = [partition_path(results_dir, strategy, num_agents) for num_agents in num_agents_values]
+        frames.extend(pd.read_csv(path) for path in paths if os.path.exists(path))
+
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.concat(frames, ignore_index=True)
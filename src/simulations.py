@@ -1,7 +1,7 @@
-import csv
+import multiprocessing
+import numpy as np
 import os
 import os.path
-import pandas as pd
 import matplotlib
 import matplotlib.pyplot as plt
 import plotly.graph_objs as go
@@ -9,26 +9,30 @@ import sys
 import time
 
 from modelController.controller import Controller
+from modelController.batch_model import simulate_batch
+from modelController.async_model import AsyncModel
+from modelController.profiling import SimulationStats
+from modelController.protocols import STANDARD
+from modelController.topology import COMPLETE
+from results import ResultsWriter, parse_spawn_key, read_results
+from aggregates import AggregateStore
+from optimal import optimal_timesteps, ratio_to_optimal
 
-def create_df(filepath):
-    """Reads or creates a pandas DataFrame."""
-    if not os.path.exists(filepath):
-        print(f"{filepath} does not exist, making new DataFrame")
-        df = pd.DataFrame(columns=['Num Simulations', 'Num Agents', 'Strategy', 'Call Protocol', 'Timesteps Taken'])
-    else:
-        print(f"Reading dataframe from {filepath}")
-        # First column is the index column
-        df = pd.read_csv(filepath, index_col=0)
-    return df
-
-def simulate_generator(num_agents, strategy, num_sim=1000):
+# Simulations that take more time-steps than this are stopped, because their strategy got stuck
+MAX_TIMESTEPS = 10000
+
+def simulate_generator(num_agents, strategy, num_sim=1000, seed=None, topology=COMPLETE, topology_params=None,
+                       protocol=STANDARD):
     """Performs num_sim simulation of the program with certain values for the parameters.
     
     This function however, will not save results to a csv file. It is a generator, meaning
     it yields the timesteps counters after every iteration.
+    The seed is passed to the Controller, so the simulations can be reproduced.
+    The topology and its parameters, and the call protocol, are passed to the Controller as well.
     """
     timesteps_counters = {}
-    mc = Controller(num_agents, strategy)
+    mc = Controller(num_agents, strategy, seed=seed, max_timesteps=MAX_TIMESTEPS,
+                    topology=topology, topology_params=topology_params, protocol=protocol)
     mc.update(num_agents, strategy)
 
     for i in range(num_sim):
@@ -36,6 +40,8 @@ def simulate_generator(num_agents, strategy, num_sim=1000):
         while not mc.simulation_finished:
             mc.simulate(print_message=False)
 
+        if mc.timed_out:
+            raise RuntimeError(f"A simulation did not finish within {MAX_TIMESTEPS} time-steps")
         if mc.simulation_finished:
             if str(mc.timesteps_taken) in timesteps_counters:
                 timesteps_counters[str(mc.timesteps_taken)] += 1
@@ -45,6 +51,50 @@ def simulate_generator(num_agents, strategy, num_sim=1000):
             mc.update(num_agents, strategy)
         yield timesteps_counters
 
+def simulate_batched(num_agents, strategy, num_sim=1000, seed=None, protocol=STANDARD):
+    """Performs num_sim simulations with the batch engine, which advances all simulations
+    together instead of one after the other.
+
+    Like simulate_generator, the results are not saved to a csv file. The timesteps
+    counters are returned directly once all simulations are finished.
+    Only the strategies that declare a batched_matching (see modelController/strategies.py)
+    can be simulated this way. Like the other helpers, it raises an error if a
+    simulation does not finish within MAX_TIMESTEPS time-steps.
+    """
+    return simulate_batch(num_agents, strategy, num_sim, seed, protocol, MAX_TIMESTEPS)
+
+def simulate_async_runs(num_agents, strategy, num_sim=1000, seed=None, protocol=STANDARD,
+                        inter_call=None, call_duration=None, max_time=None):
+    """Performs num_sim simulations with the event-driven engine, in which the agents
+    call each other in continuous time instead of in time-steps.
+
+    Input arguments:
+    num_agents -- The number of agents in a simulation
+    strategy -- The strategy the agents will use
+    num_sim -- The number of simulations
+    seed -- The seed of the simulations, None for a random seed
+    protocol -- The call protocol the agents will use
+    inter_call, call_duration -- The distributions of the time between the calls of
+        an agent and of the duration of a call, see modelController/async_model.py
+    max_time -- Simulations that take a longer simulated time than this raise an error,
+        None for MAX_TIMESTEPS rounds (see AsyncModel.round_length), like the time-steps
+        of the synchronous engines
+
+    Output:
+    completion_times -- A list with a (simulated time, time in rounds) tuple for every
+        simulation, see AsyncModel.time_in_rounds
+    """
+    rng = np.random.default_rng(seed)
+    completion_times = []
+    for i in range(num_sim):
+        model = AsyncModel(num_agents, strategy, rng, protocol, inter_call, call_duration)
+        time_limit = max_time if max_time is not None else MAX_TIMESTEPS * model.round_length()
+        model.run(time_limit)
+        if model.timed_out:
+            raise RuntimeError(f"A simulation did not finish within a simulated time of {time_limit}")
+        completion_times.append((model.time, model.time_in_rounds()))
+    return completion_times
+
 def make_histogram_for_frontend(counters):
     """Makes histograms for in the UI.
     
@@ -69,78 +119,314 @@ def make_histogram_for_frontend(counters):
     )
     return fig
 
-def simulate(num_agents, strategy, sims_filepath, num_sim=1000):
-    """Perform num_sim simulations of the program with certain values for the parameters.
+def run_seed_sequences(seed, num_sim):
+    """Returns the SeedSequence of every simulation of a sequence of num_sim simulations.
+
+    Simulation i gets the child with spawn key i of the root SeedSequence, so the
+    seed of a simulation does not depend on the simulations before it, and every
+    single simulation can be reproduced from its entropy and spawn key.
+
+    Input arguments:
+    seed -- The seed (an int or SeedSequence) of the root SeedSequence, None for a random seed
+    num_sim -- The number of simulations
+    """
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    return [np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (i,), pool_size=root.pool_size)
+            for i in range(num_sim)]
+
+def iterate_runs(num_agents, strategy, num_sim, print_progress=True, seed=None,
+                 topology=COMPLETE, topology_params=None, protocol=STANDARD, stats=None):
+    """Performs num_sim simulations and yields the number of timesteps each one took,
+    as soon as the simulation is finished.
+
+    Every simulation draws from its own SeedSequence, see run_seed_sequences.
 
     Input arguments:
     num_agents -- The number of agents in a simulation
     strategy -- The strategy the agents will use
-    sims_filepath -- The filepath where the dataframe is saved into
-    num_sim -- The number of simulations per configuration
-
-    This function performs the simulations, and record the number of timesteps it takes for each
-    iteration, after which the average and standard deviation of the number of timesteps taken
-    can be computed.
+    num_sim -- The number of simulations
+    print_progress -- If True, the progress is printed to stdout
+    seed -- The seed (an int or SeedSequence) of the simulations, None for a random seed
+    topology -- The name of the topology the agents can call each other over
+    topology_params -- A dictionary with the parameters of the topology
+    protocol -- The call protocol the agents will use
+    stats -- If not None, the SimulationStats the simulations are profiled into
     """
-    df = create_df(sims_filepath)
-    new_rows = pd.DataFrame(columns=['Num Simulations', 'Num Agents', 'Strategy', 'Call Protocol', 'Timesteps Taken'])
-
-    mc = Controller(num_agents, strategy)
-    mc.update(num_agents, strategy)
+    seed_sequences = run_seed_sequences(seed, num_sim)
+    mc = Controller(num_agents, strategy, max_timesteps=MAX_TIMESTEPS,
+                    topology=topology, topology_params=topology_params, protocol=protocol, stats=stats)
     # Start the simulations and record the timesteps taken
 
-    total_timesteps_taken = 0
     for i in range(num_sim):
+        mc.reset_simulation(print_message=False, seed=seed_sequences[i])
+        mc.update(num_agents, strategy)
         mc.start_simulation(print_message=False)
         while not mc.simulation_finished:
             mc.simulate(print_message=False)
 
-        if mc.simulation_finished:
-            new_row = pd.Series({"Num Simulations": num_sim,
-                                 "Num Agents": num_agents, 
-                                 "Strategy": strategy, 
-                                 "Timesteps Taken": mc.timesteps_taken})
-            new_rows = new_rows.append(new_row, ignore_index=True)
-            total_timesteps_taken += mc.timesteps_taken
-            mc.reset_simulation(print_message=False)
-            mc.update(num_agents, strategy)
+        if mc.timed_out:
+            raise RuntimeError(f"A simulation did not finish within {MAX_TIMESTEPS} time-steps")
+        yield mc.timesteps_taken
 
         # Prints the progress
-        print(f"Num agents: {num_agents}, Strategy: {strategy} -- Iteration: {i+1} / {num_sim}", end='\r')
-    print()
+        if print_progress:
+            print(f"Num agents: {num_agents}, Strategy: {strategy} -- Iteration: {i+1} / {num_sim}", end='\r')
+    if print_progress:
+        print()
+
+def simulate_runs(num_agents, strategy, num_sim, print_progress=True, seed=None,
+                  topology=COMPLETE, topology_params=None, protocol=STANDARD, stats=None):
+    """Performs num_sim simulations and returns the list of timesteps each one took."""
+    return list(iterate_runs(num_agents, strategy, num_sim, print_progress, seed, topology, topology_params,
+                             protocol, stats))
+
+def replay_run(num_agents, strategy, seed, spawn_key, topology=COMPLETE, topology_params=None, protocol=STANDARD):
+    """Reproduces a single simulation of a sweep, from the Seed and Spawn Key stored
+    with its result (see results.py), and returns the Controller after it finished.
+
+    Input arguments:
+    num_agents -- The number of agents in the simulation
+    strategy -- The strategy the agents used
+    seed -- The entropy of the SeedSequence of the simulation
+    spawn_key -- The spawn key of the SeedSequence of the simulation, a tuple, or the
+        value of its Spawn Key column (see results.format_spawn_key)
+    topology, topology_params, protocol -- The settings the simulation was made with
+    """
+    if not isinstance(spawn_key, tuple):
+        spawn_key = parse_spawn_key(spawn_key)
+    mc = Controller(num_agents, strategy, seed=np.random.SeedSequence(int(seed), spawn_key=spawn_key),
+                    max_timesteps=MAX_TIMESTEPS, topology=topology, topology_params=topology_params,
+                    protocol=protocol)
+    mc.update(num_agents, strategy)
+    mc.start_simulation(print_message=False)
+    while not mc.simulation_finished:
+        mc.simulate(print_message=False)
+    return mc
+
+def profile_path(results_dir, strategy, num_agents, protocol=STANDARD):
+    """Returns the path of the JSON file with the profile of the simulations of a
+    configuration. The profiles are kept in a directory next to the results directory,
+    {results_dir}_profiles, so they are never read as results."""
+    name = f"{num_agents}_agents" if protocol == STANDARD else f"{num_agents}_agents_{protocol}"
+    return os.path.join(f"{os.path.normpath(results_dir)}_profiles", strategy, f"{name}_profile.json")
+
+def save_profile(stats, results_dir, strategy, num_agents, protocol=STANDARD):
+    """Saves the SimulationStats of the simulations of a configuration, and prints them."""
+    filename = profile_path(results_dir, strategy, num_agents, protocol)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    stats.save(filename)
+    print(stats.summary())
+
+def print_summary(num_agents, strategy, store, protocol=STANDARD):
+    """Prints the number of results, and the average and standard deviation of the
+    timesteps taken of all saved results with these settings. The average is also
+    compared to the optimal number of timesteps.
 
-    df = df.append(new_rows)
-    df.to_csv(sims_filepath)
-    # Select the rows of the DataFrame that use the settings given as arguments to this func (simulate)
-    res_df = df.loc[(df['Num Agents'] == num_agents) & (df['Strategy'] == strategy)]
-    print(f"There are {len(res_df['Timesteps Taken'])} entries in the csv file, using these settings.")
-    average_timesteps = res_df['Timesteps Taken'].mean(skipna=True)
-    std_timesteps = res_df['Timesteps Taken'].std(skipna=True)
+    Input arguments:
+    num_agents -- The number of agents in the simulations
+    strategy -- The strategy the agents used
+    store -- The AggregateStore of the results
+    protocol -- The call protocol the agents used
+    """
+    stats = store.get(strategy, num_agents, protocol)
+    print(f"There are {stats.count} entries in the results, using these settings.")
+    average_timesteps = stats.mean
+    std_timesteps = stats.std()
     print("Average timesteps taken with these settings: {:.4}".format(average_timesteps))
     print("Standard deviation of timesteps taken with these settings: {:.4}".format(std_timesteps))
+    ratio = ratio_to_optimal(average_timesteps, num_agents)
+    if ratio is not None:
+        print("Ratio to the optimal {} timesteps: {:.4}".format(optimal_timesteps(num_agents), ratio))
     print()
 
+def simulate(num_agents, strategy, results_dir, num_sim=1000, seed=None, topology=COMPLETE, topology_params=None,
+             protocol=STANDARD, profile=False):
+    """Perform num_sim simulations of the program with certain values for the parameters.
+
+    Input arguments:
+    num_agents -- The number of agents in a simulation
+    strategy -- The strategy the agents will use
+    results_dir -- The directory the results are appended to, the results of
+        different topologies should be kept in different directories
+    num_sim -- The number of simulations per configuration
+    seed -- The seed of the simulations, None for a random seed
+    topology -- The name of the topology the agents can call each other over
+    topology_params -- A dictionary with the parameters of the topology
+    protocol -- The call protocol the agents will use, it is stored with the results
+    profile -- If True, the simulations are profiled, and the profile is saved next
+        to the results (see profile_path)
+
+    This function performs the simulations, and record the number of timesteps it takes for each
+    iteration, after which the average and standard deviation of the number of timesteps taken
+    can be computed.
+    """
+    stats = SimulationStats() if profile else None
+    store = AggregateStore.for_results(results_dir)
+    # The seeds of the simulations are stored with the results, so the root is made here
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    seed_sequences = run_seed_sequences(root, num_sim)
+    # The results are only saved once all simulations finished, so the csv files and
+    # the aggregate store stay in sync if a simulation gets stuck
+    timesteps_taken = simulate_runs(num_agents, strategy, num_sim, seed=root, topology=topology,
+                                    topology_params=topology_params, protocol=protocol, stats=stats)
+    with ResultsWriter(results_dir) as writer:
+        writer.add_many(num_sim, num_agents, strategy, timesteps_taken, protocol, seed_sequences)
+        store.add_many(strategy, num_agents, timesteps_taken, protocol)
+    store.save()
+    print_summary(num_agents, strategy, store, protocol)
+    if profile:
+        save_profile(stats, results_dir, strategy, num_agents, protocol)
+
+def simulate_chunk(work_unit):
+    """Performs one work unit of a parallel sweep, in a worker process.
+
+    Every simulation of the work unit draws from its own child of the work unit's
+    SeedSequence (see run_seed_sequences), so the random streams are independent,
+    and the seeds of the results can be found again from the work unit.
+
+    Input arguments:
+    work_unit -- A tuple (num_agents, strategy, protocol, seed_sequence, num_sim, topology, topology_params,
+        profile)
+
+    Output:
+    timesteps_taken -- The list of timesteps each simulation of this work unit took
+    stats -- The SimulationStats of the work unit if profile is True, otherwise None
+    """
+    num_agents, strategy, protocol, seed_sequence, num_sim, topology, topology_params, profile = work_unit
+    stats = SimulationStats() if profile else None
+    timesteps_taken = simulate_runs(num_agents, strategy, num_sim, print_progress=False, seed=seed_sequence,
+                                    topology=topology, topology_params=topology_params, protocol=protocol,
+                                    stats=stats)
+    return timesteps_taken, stats
+
+def make_work_units(configurations, num_sim, chunk_size, seed=None, topology=COMPLETE, topology_params=None,
+                    profile=False):
+    """Splits the simulations of every configuration up in work units of at most
+    chunk_size simulations.
 
-def make_histogram(num_agents, strategy, df_filepath):
+    Every work unit gets its own child of one root SeedSequence, so the random
+    streams of the work units are independent, and a sweep can be repeated by
+    passing the same seed.
+
+    Input arguments:
+    configurations -- A list of (num_agents, strategy, protocol) tuples
+    num_sim -- The number of simulations per configuration
+    chunk_size -- The maximum number of simulations per work unit
+    seed -- The seed of the root SeedSequence, None for a random seed
+    topology -- The name of the topology the agents can call each other over
+    topology_params -- A dictionary with the parameters of the topology
+    profile -- If True, the simulations of the work units are profiled
+
+    Output:
+    work_units -- A list of (num_agents, strategy, protocol, seed_sequence, num_sim, topology,
+        topology_params, profile) tuples, the work units of a configuration are next to each other.
+    """
+    chunks = [min(chunk_size, num_sim - start) for start in range(0, num_sim, chunk_size)]
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(configurations) * len(chunks))
+    work_units = []
+    for num_agents, strategy, protocol in configurations:
+        for chunk in chunks:
+            work_units.append((num_agents, strategy, protocol, seed_sequences[len(work_units)], chunk,
+                               topology, topology_params, profile))
+    return work_units
+
+def simulate_parallel(num_agents_values, strategies, results_dir, num_sim=1000,
+                      processes=None, chunk_size=50, seed=None, topology=COMPLETE, topology_params=None,
+                      protocols=(STANDARD,), profile=False):
+    """Performs the simulations of every combination of num_agents_values, strategies
+    and protocols in a pool of worker processes.
+
+    The simulations are split up in work units of at most chunk_size simulations, which
+    are farmed out to the workers. Once all work units of a configuration are done, their
+    results are appended to the results, the summary is printed and the histogram is
+    made, just like in the serial sweep. If a work unit of a configuration fails (a
+    simulation got stuck, for example), no results of that configuration are saved.
+
+    Input arguments:
+    num_agents_values -- The numbers of agents to simulate
+    strategies -- The strategies to simulate
+    results_dir -- The directory the results are appended to, the results of
+        different topologies should be kept in different directories
+    num_sim -- The number of simulations per configuration
+    processes -- The number of worker processes, None for the number of CPUs
+    chunk_size -- The maximum number of simulations per work unit
+    seed -- The seed for the random streams of the workers, None for a random seed
+    topology -- The name of the topology the agents can call each other over
+    topology_params -- A dictionary with the parameters of the topology
+    protocols -- The call protocols to simulate, they are stored with the results
+    profile -- If True, the simulations are profiled, and the profile of every
+        configuration is saved next to its results (see profile_path)
+    """
+    configurations = [(num_agents, strategy, protocol) for num_agents in num_agents_values
+                      for strategy in strategies for protocol in protocols]
+    work_units = make_work_units(configurations, num_sim, chunk_size, seed, topology, topology_params, profile)
+    units_per_configuration = len(work_units) // len(configurations)
+
+    store = AggregateStore.for_results(results_dir)
+    start_time = time.time()
+    with multiprocessing.Pool(processes) as pool, ResultsWriter(results_dir) as writer:
+        results = pool.imap(simulate_chunk, work_units)
+        for configuration_index, (num_agents, strategy, protocol) in enumerate(configurations):
+            failed = False
+            stats = SimulationStats() if profile else None
+            # The results of the work units are only saved once all of them succeeded,
+            # so the saved results of a configuration are never biased towards the
+            # simulations that did not get stuck
+            unit_results = []
+            for i in range(units_per_configuration):
+                unit_index = configuration_index * units_per_configuration + i
+                try:
+                    timesteps_taken, unit_stats = next(results)
+                except Exception as e:
+                    if not failed:
+                        print(f"Something went wrong during {strategy} ({protocol}), no results are saved")
+                        print(e)
+                    failed = True
+                    continue
+                unit_results.append((work_units[unit_index], timesteps_taken))
+                if profile:
+                    stats.merge(unit_stats)
+            if failed:
+                continue
+            num_done = 0
+            for work_unit, timesteps_taken in unit_results:
+                writer.add_many(num_sim, num_agents, strategy, timesteps_taken, protocol,
+                                run_seed_sequences(work_unit[3], len(timesteps_taken)))
+                store.add_many(strategy, num_agents, timesteps_taken, protocol)
+                num_done += len(timesteps_taken)
+            writer.flush()
+            store.save()
+            print(f"Num agents: {num_agents}, Strategy: {strategy}, Call protocol: {protocol} -- {num_done} simulations done")
+            print_summary(num_agents, strategy, store, protocol)
+            make_histogram(num_agents, strategy, results_dir, protocol)
+            if profile:
+                save_profile(stats, results_dir, strategy, num_agents, protocol)
+            end_time = time.time() - start_time
+            print(f"Strat {strategy}, n = {num_agents}, done after {end_time} seconds")
+
+
+def make_histogram(num_agents, strategy, results_dir, protocol=STANDARD):
     """This function creates a histogram based 
     on the arguments given and saves it in the data folder.
     
     Input arguments:
     num_agents -- Num agents in the simulation (and graphs)
     strategy -- Strategy used by agents in the simulation
-    df_filepath -- The DataFrame object is stored in a csv file.
-        This is the filepath to that csv file.
+    results_dir -- The directory the results are stored in.
+    protocol -- The call protocol used by the agents, results without a call
+        protocol were made with the Standard protocol.
     """
-    df = pd.read_csv(df_filepath, index_col=0)
-    df = df.loc[(df['Num Agents'] == num_agents) & (df['Strategy'] == strategy)]
+    df = read_results(results_dir, [strategy], [num_agents])
+    df = df[df["Call Protocol"].fillna(STANDARD) == protocol]
     num_bins = max(df["Timesteps Taken"]) - min(df["Timesteps Taken"])
     fig = plt.figure()
     ax = df["Timesteps Taken"].hist(bins=num_bins, density=1, align='left', histtype='bar', rwidth=0.9)
-    plt.title(f"Strategy: {strategy}, Number of agents: {num_agents}")
+    plt.title(f"Strategy: {strategy}, Call protocol: {protocol}, Number of agents: {num_agents}")
     plt.xlabel(f"Time-steps taken")
     plt.ylabel(f"Percentage")
 
-    filename = f"data/{strategy}_{num_agents}_agents_hist.png"
+    name = strategy if protocol == STANDARD else f"{strategy}_{protocol}"
+    filename = f"data/{name}_{num_agents}_agents_hist.png"
     plt.savefig(filename)
     plt.close(fig)
 
@@ -148,12 +434,16 @@ def make_histogram(num_agents, strategy, df_filepath):
 if __name__ == "__main__":
     ################################################## Uncomment for simulations!
     if len(sys.argv) != 2:
-        exit("wrong number of arguments, give filename as an argument")
+        exit("wrong number of arguments, give the name of the results directory as an argument")
+
+    results_name = sys.argv[1]
 
-    file_name = sys.argv[1]
+    # The topology the agents can call each other over, see modelController/topology.py
+    topology = COMPLETE
+    topology_params = {}
 
     data_dir = "data"
-    sims_filepath = f"{data_dir}/{file_name}.csv"
+    results_dir = f"{data_dir}/{results_name}"
     if not os.path.isdir(data_dir):
         os.mkdir(data_dir)
 
@@ -161,17 +451,11 @@ if __name__ == "__main__":
     num_agents_values = [5]
     strategies = ["Random", "Learn-New-Secrets", "Bubble", "Mathematical",
      "Call-Me-Once", "Most-useful" , "Min-Secrets", "Max-Secrets", "Token", "Spider"]
+    # The call protocols, see modelController/protocols.py
+    protocols = [STANDARD]
+    # If True, the time spent in every phase of the simulations is saved next to the results
+    profile = False
 
-    for num_agents in num_agents_values:
-        for strategy in strategies:
-            start_time = time.time()
-            try:
-                simulate(num_agents, strategy, sims_filepath)
-                make_histogram(num_agents, strategy, sims_filepath)
-            except Exception as e:
-                print(f"Something went wrong during {strategy}")
-                print(e)
-                continue
-            end_time = time.time() - start_time
-            print(f"Strat {strategy}, n = {num_agents}, took {end_time} seconds")
+    simulate_parallel(num_agents_values, strategies, results_dir,
+                      topology=topology, topology_params=topology_params, protocols=protocols, profile=profile)
     #############################################################################
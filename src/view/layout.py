@@ -6,6 +6,9 @@ dash_core_components."""
 import dash_html_components as html
 import dash_core_components as dcc
 
+# The largest number of agents that can be chosen with the slider
+MAX_NUM_AGENTS = 5000
+
 def layout(default_num_agents, update_interval):
 	return html.Div(
 		        [html.Div(
@@ -38,8 +41,10 @@ def layout(default_num_agents, update_interval):
 		                        html.Div(
 		                            dcc.Slider(id='num_nodes', 
 		                               min=3, 
-		                               max=100,
-		                               marks={i: str(i) if i%5 == 0 else str("") for i in range(3, 101)},
+		                               max=MAX_NUM_AGENTS,
+		                               step=1,
+		                               marks={i: str(i) for i in [3] + list(range(500, MAX_NUM_AGENTS + 1, 500))},
+		                               tooltip={'placement': 'bottom'},
 		                               value=default_num_agents,
 		                            ),
 		                            style={
@@ -90,6 +95,11 @@ def layout(default_num_agents, update_interval):
 		                    id="output-strategy"
 		                ),
 		                html.Div(html.P(id='timestep')),
+		                # The base figure of the graph, the changes of every interval, and the
+		                # version and snapshot the browser shows (see render_graph in ui.py)
+		                dcc.Store(id='graph_base'),
+		                dcc.Store(id='graph_delta'),
+		                dcc.Store(id='graph_applied'),
 		                dcc.Interval(
 		                    id='interval_component',
 		                    interval=update_interval, #ms
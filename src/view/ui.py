@@ -4,15 +4,25 @@ in pythonic ways, which is done here. There are some callback functions, denoted
 with the @app-callback decorators that change the Dash app in different ways as it
 is running. Most callbacks are called when the user interacts with the UI. The
 render_graph callback is also called every 'update_interval'.
+The graph is drawn with WebGL traces. The whole figure is only sent to the browser
+when the graph changes (a different number of agents or topology). Every interval
+only the changes since the figure the browser shows are sent, and the
+apply_graph_delta clientside callback updates the figure in the browser.
+The simulation itself runs in a SimulationWorker thread (see worker.py), the
+callbacks only read the latest snapshot of it, and start, pause and reset it.
+The simulations of a histogram run in a pool of processes (a HistogramJob of the HistogramPool).
 """
 
-import networkx as nx
+import itertools
 import dash
+from dash.exceptions import PreventUpdate
 from dash.dependencies import Input, Output, State
 import plotly.graph_objs as go
 import math
-from simulations import simulate_generator, make_histogram_for_frontend
+import numpy as np
+from simulations import make_histogram_for_frontend
 import view.layout as layout
+from view.worker import HistogramPool, SimulationWorker
 
 # external CSS stylesheets
 external_stylesheets = [
@@ -32,168 +42,241 @@ app.layout = layout.layout(default_num_agents, update_interval)
     
 # Global variables used in render_graph, this has to be used since an output can only have 1 callback
 # But we need to save the states
-num_nodes_state = 0
-base_figure = go.Figure()
-G = nx.Graph()
-computing_histogram = False
-generator = None
+# The (number of agents, topology) of the base figure, its version number, and the positions of the nodes
+base_key = None
+base_version = 0
+node_x = np.zeros(0)
+node_y = np.zeros(0)
+# The pool of processes the histograms are computed in, it is made once and reused
+histogram_pool = HistogramPool()
+histogram_job = None
+# True once the histogram of a finished job is shown, so it does not have to be made again
+histogram_shown = False
 num_sims = 1000
-timesteps_counter = {}                  
 
 def run_ui(ctrl, def_num_agents):
-    """Runs the Dash UI, which is displayed in a web-browser."""
+    """Runs the Dash UI, which is displayed in a web-browser.
+
+    The simulation of the controller is run by a SimulationWorker thread, which
+    makes one time-step every update_interval, like the graph is updated.
+    """
     global controller
+    global worker
     global default_num_agents
     controller = ctrl
     default_num_agents = def_num_agents
+    worker = SimulationWorker(controller, update_interval / 1000)
+    worker.start()
     app.run_server(debug=True)
 
+def make_line_coordinates(edges):
+    """Returns the x and y coordinates of a single trace that draws all edges as lines.
+
+    The lines are separated by None, so plotly does not connect them to each other.
+
+    Input arguments:
+    edges -- A sequence of (agent id, agent id) pairs
+    """
+    edges = np.asarray(edges, dtype=int).reshape(-1, 2)
+    x = np.full((len(edges), 3), None, dtype=object)
+    y = np.full((len(edges), 3), None, dtype=object)
+    x[:, 0] = node_x[edges[:, 0]]
+    x[:, 1] = node_x[edges[:, 1]]
+    y[:, 0] = node_y[edges[:, 0]]
+    y[:, 1] = node_y[edges[:, 1]]
+    return x.ravel().tolist(), y.ravel().tolist()
+
+def make_base_figure(snapshot):
+    """Makes the figure of the graph, with the edges of the topology, the nodes and
+    the (still empty) trace of the calls of a time-step.
+
+    The nodes are placed on a circle. If there is no topology, the edges of the
+    complete graph are only drawn for less than 11 agents.
+    """
+    global node_x
+    global node_y
+    num_nodes = snapshot.num_agents
+    angles = np.arange(1, num_nodes + 1) * 2 * math.pi / max(num_nodes, 1)
+    circle_radius = 0.8
+    node_x = circle_radius * np.cos(angles)
+    node_y = circle_radius * np.sin(angles)
+
+    if snapshot.topology is not None:
+        edges = snapshot.topology.edges()
+    elif num_nodes < 11:
+        edges = list(itertools.combinations(range(num_nodes), 2))
+    else:
+        edges = []
+    edge_x, edge_y = make_line_coordinates(edges)
+    edge_trace = go.Scattergl(
+        x=edge_x,
+        y=edge_y,
+        line=dict(width=0.5, color='#888'),
+        hoverinfo='none',
+        mode='lines')
+
+    node_trace = go.Scattergl(
+        x=node_x.tolist(),
+        y=node_y.tolist(),
+        text=list(snapshot.labels),
+        mode='markers',
+        hovertemplate='Name: %{text}<br># of secrets: %{marker.color}<extra></extra>',
+        marker=dict(
+            showscale=True,
+            colorscale='Viridis',
+            reversescale=False,
+            color=list(snapshot.secret_counts),
+            cmax=num_nodes,
+            cmin=1,
+            size=100 // math.sqrt(max(num_nodes, 1)) + 10,
+            colorbar=dict(
+                thickness=15,
+                title='Secrets known',
+                xanchor='left',
+                titleside='right'
+            ),
+            line=dict(width=2 if num_nodes <= 100 else 0)))
+
+    # The calls of a time-step are all drawn by this one trace
+    call_trace = go.Scattergl(
+        x=[],
+        y=[],
+        mode='lines',
+        hoverinfo='none',
+        line=dict(color='red'))
+
+    return go.Figure(data=[edge_trace, node_trace, call_trace],
+                layout=go.Layout(
+                title='',
+                titlefont=dict(size=16),
+                showlegend=False,
+                hovermode='closest',
+                # Keeps the zoom of the user when the figure is updated
+                uirevision=True,
+                margin=dict(b=20, l=5, r=5, t=40),
+                annotations=[ dict(
+                    showarrow=False,
+                    xref="paper", yref="paper",
+                    x=0.005, y=-0.002 ) ],
+                xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
+                yaxis=dict(showgrid=False, zeroline=False, showticklabels=False)))
+
+def make_graph_delta(snapshot, previous):
+    """Makes the changes of the graph from the snapshot previous to snapshot.
+
+    Output:
+    delta -- A dictionary with the key (run, time-steps taken) of snapshot, the ids
+        of the agents whose number of secrets changed and their new numbers of secrets,
+        and the ids of the agents in the calls of the last time-step, two per call.
+        If previous is None, all agents are in the delta.
+    """
+    secret_counts = np.array(snapshot.secret_counts, dtype=int)
+    if previous is None:
+        changed = np.arange(snapshot.num_agents)
+    else:
+        changed = np.flatnonzero(secret_counts != np.array(previous.secret_counts, dtype=int))
+    return {
+        'key': [snapshot.run, snapshot.timesteps_taken],
+        'nodes': changed.tolist(),
+        'counts': secret_counts[changed].tolist(),
+        'calls': [agent_id for connection in snapshot.connections for agent_id in connection],
+    }
+
 # This has to be such a big function because a Dash output can only have one callback connected to it.
 # And since we want to update the graph with most of what we do, we have to put all that logic in this function.
 @app.callback(
-    [Output('Graph','figure'),
+    [Output('graph_base', 'data'),
+    Output('graph_delta', 'data'),
     Output('timestep', 'children')],
     [Input('num_nodes','value'),
     Input('interval_component','n_intervals'),
-    Input('strategy','value')])
-def render_graph(num_nodes, n_intervals, strategy):
-    """Creates the nodes-and-edges graph that is displayed in the web-browser.
+    Input('strategy','value')],
+    [State('graph_applied', 'data')])
+def render_graph(num_nodes, n_intervals, strategy, applied):
+    """Sends the changes of the nodes-and-edges graph that is displayed in the web-browser.
 
     The decorator specifies which inputs and outputs this function has.
     Whenever one of the inputs changes in the Dash-app, this function is called.
     The inputs are:
         num_nodes -- The number of agents in the simulation (slider in Dash-app)
         n_intervals -- A value that increases every update_interval. This is used
-            in order to update the graph when the simulation is running.
+            in order to update the graph with the latest snapshot of the simulation,
+            which is run by the worker.
         strategy -- A string chosen from a Dropdown-menu in the Dash app.
             It specifies which strategy the agents should use.
+        applied -- The version of the base figure and the key of the last snapshot
+            that the browser shows, [base version, run, time-steps taken].
     The outputs are:
-        The graph-figure -- the actual nodes-and-edges graph displayed in the app
+        The base figure -- The whole figure with its version, only if the browser
+            does not have the figure of this number of agents and topology yet.
+        The delta -- The changes since the snapshot the browser shows, see
+            make_graph_delta. If the browser shows a snapshot that is no longer in
+            the ring buffer of the worker, all agents are sent.
         Number of time-steps -- The number of time-steps is displayed in a div in
             the Dash-app
     """
-    global num_nodes_state
-    global base_figure
-    global G
-
-    controller.update(num_nodes, strategy)
-    simulation_finished = controller.simulate()
-
-    # We only need to recompute the base graph whenever the number of agents changes
-    if num_nodes_state != num_nodes:
-        num_nodes_state = num_nodes
-        # Calculate positions for the nodes of the graph
-        circle_center = (0, 0)
-        circle_radius = 0.8
-        positions = {i: (circle_center[0] + circle_radius * math.cos(i*2 * math.pi / num_nodes),
-                         circle_center[1] + circle_radius * math.sin(i*2 * math.pi / num_nodes)) for i in range(1, num_nodes + 1)}
-
-        # Make a complete graph
-        if(num_nodes < 11):
-            G = nx.complete_graph(num_nodes)
-        else:
-            G = nx.Graph()
-            for i in range(num_nodes):
-                G.add_node(i)
-        for node, position in zip(G.nodes, positions.values()):
-            G.nodes[node]["pos"] = position
-        pos = nx.get_node_attributes(G, 'pos')
-
-        # Create Edges
-        edge_trace = go.Scatter(
-            x=[],
-            y=[],
-            line=dict(width=0.5, color='#888'),
-            hoverinfo='none',
-            mode='lines')
-
-        for edge in G.edges():
-            x0, y0 = G.node[edge[0]]['pos']
-            x1, y1 = G.node[edge[1]]['pos']
-            edge_trace['x'] += tuple([x0, x1, None])
-            edge_trace['y'] += tuple([y0, y1, None])
-
-        node_trace = go.Scatter(
-            x=[],
-            y=[],
-            text=[],
-            mode='markers',
-            hoverinfo='text',
-            marker=dict(
-                showscale=True,
-                colorscale='Viridis',
-                reversescale=False,
-                color=[],
-                cmax=len(controller.model.agents),
-                cmin=1,
-                size=100 // math.sqrt(num_nodes) + 10,
-                colorbar=dict(
-                    thickness=15,
-                    title='Secrets known',
-                    xanchor='left',
-                    titleside='right'
-                ),
-                line=dict(width=2)))
-
-        for node in G.nodes():
-            x, y = G.node[node]['pos']
-            node_trace['x'] += tuple([x])
-            node_trace['y'] += tuple([y])
-
-        # add color to node points, based on the number of secrets the agents know
-        # This only gets called if num_nodes has changed
-        agents = controller.model.agents
-        for node in G.nodes:
-            agent = agents[node]
-            num_secrets_known = len(agent.secrets)
-            node_trace['marker']['color'] += (num_secrets_known, )
-            node_info = 'Name: ' + str(agent) + '<br># of secrets: ' + str(num_secrets_known)
-            node_trace['text'] += (node_info,)
-
-        fig = go.Figure(data=[edge_trace, node_trace],
-                    layout=go.Layout(
-                    # title='<br>Network Graph of ' + str(num_nodes) + ' agents',
-                    title='',
-                    titlefont=dict(size=16),
-                    showlegend=False,
-                    hovermode='closest',
-                    margin=dict(b=20, l=5, r=5, t=40),
-                    annotations=[ dict(
-                        showarrow=False,
-                        xref="paper", yref="paper",
-                        x=0.005, y=-0.002 ) ],
-                    xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
-                    yaxis=dict(showgrid=False, zeroline=False, showticklabels=False)))
-        base_figure = fig
+    global base_key
+    global base_version
+
+    worker.update(num_nodes, strategy)
+    snapshot = worker.latest()
+
+    # We only need to recompute the base graph whenever the number of agents (or the topology) changes
+    base = dash.no_update
+    previous = None
+    if base_key != (snapshot.num_agents, snapshot.topology):
+        base_key = (snapshot.num_agents, snapshot.topology)
+        base_version += 1
+        base = {'version': base_version, 'figure': make_base_figure(snapshot).to_dict()}
+    elif applied is None or applied[0] != base_version:
+        base = {'version': base_version, 'figure': make_base_figure(snapshot).to_dict()}
     else:
-        fig = base_figure
-        fig.data = fig.data[0:2] # Only take the edge and node traces
-
-    # Change the colors and information of the fig here
-    # This gets called every interval
-    marker_colors = []
-    marker_information = []
-    agents = controller.model.agents
-    for agent in agents:
-        marker_colors.append(len(agent.secrets))
-        marker_information.append('Name: ' + str(agent) + '<br># of secrets: ' + str(len(agent.secrets)))
-    fig.data[1].marker.color = tuple(marker_colors)
-    fig.data[1].text = tuple(marker_information)
-
-    # This part adds red edges on the graph to signify which connections have been made
-    additional_edge_traces = controller.model.connections
-    for aet in additional_edge_traces:
-        node1, node2 = aet
-        x1, y1 = G.nodes[node1]['pos']
-        x2, y2 = G.nodes[node2]['pos']
-        line = go.Scatter(x=[x1, x2],
-                          y=[y1, y2],
-                          mode='lines',
-                          line=go.scatter.Line(color='red'))
-        fig.add_trace(line)
-
-    # Return the figure and the number of time steps taken
-    return fig, 'Time step: ' + str(controller.timesteps_taken)
+        previous = worker.find(applied[1], applied[2])
+
+    # Return the changes of the figure and the number of time steps taken
+    return base, make_graph_delta(snapshot, previous), 'Time step: ' + str(snapshot.timesteps_taken)
+
+# Applies the base figure and the delta of render_graph to the figure in the browser,
+# so the figure itself does not have to be sent every interval
+app.clientside_callback(
+    """
+    function(base, delta, figure) {
+        var triggered = dash_clientside.callback_context.triggered.map(function(t) { return t.prop_id; });
+        if (!base) {
+            return [figure, null];
+        }
+        if (triggered.indexOf('graph_base.data') >= 0 || !figure || !figure.data || figure.data.length < 3) {
+            figure = base.figure;
+        }
+        if (!delta) {
+            return [figure, null];
+        }
+        var nodes = figure.data[1];
+        var color = nodes.marker.color.slice();
+        for (var i = 0; i < delta.nodes.length; i++) {
+            color[delta.nodes[i]] = delta.counts[i];
+        }
+        var x = [];
+        var y = [];
+        for (var k = 0; k < delta.calls.length; k += 2) {
+            var a = delta.calls[k];
+            var b = delta.calls[k + 1];
+            x.push(nodes.x[a], nodes.x[b], null);
+            y.push(nodes.y[a], nodes.y[b], null);
+        }
+        var data = [
+            figure.data[0],
+            Object.assign({}, nodes, {marker: Object.assign({}, nodes.marker, {color: color})}),
+            Object.assign({}, figure.data[2], {x: x, y: y})
+        ];
+        return [Object.assign({}, figure, {data: data}), [base.version].concat(delta.key)];
+    }
+    """,
+    [Output('Graph', 'figure'),
+    Output('graph_applied', 'data')],
+    [Input('graph_base', 'data'),
+    Input('graph_delta', 'data')],
+    [State('Graph', 'figure')])
 
 @app.callback(
     Output('start_simulation', 'disabled'),
@@ -267,10 +350,10 @@ def start_simulation(start_clicks):
     'Already finished!'.
     """
     if start_clicks == 1:
-        controller.start_simulation()
+        worker.start_simulation()
         button_text = "Pause simulation"
     elif start_clicks is not None and start_clicks % 2 == 1:
-        controller.resume_simulation()
+        worker.resume_simulation()
         button_text = "Pause simulation"
     elif start_clicks is None:
         button_text = "Start simulation"
@@ -279,7 +362,7 @@ def start_simulation(start_clicks):
             button_text = "Already finished!"
         else:
             button_text = "Resume simulation"
-            controller.pause_simulation()
+            worker.pause_simulation()
     return button_text
 
 @app.callback(
@@ -293,11 +376,12 @@ def reset_simulation(n_clicks):
     Also resets the n_clicks variable of the start button and comp hist button.
     This in turn resets a lot of the disabled buttons and other HTML elements.
     """
-    global computing_histogram
-    computing_histogram = False
+    global histogram_job
+    histogram_pool.cancel()
+    histogram_job = None
 
     if n_clicks is not None:
-        controller.reset_simulation()
+        worker.reset_simulation()
     return None, 0, None
 
 @app.callback(
@@ -308,9 +392,11 @@ def change_speed(speed_factor):
 
     The input argument 'speed_factor' is read from the slider in the UI.
     This speed_factor starts out at 1, but when the speed_factor is changed,
-    the new update interval becomes update_interval / speed_factor
+    the new update interval becomes update_interval / speed_factor.
+    The worker makes the time-steps of the simulation at the same interval.
     """
     new_interval = update_interval / speed_factor
+    worker.step_interval = new_interval / 1000
     return int(new_interval)
 
 
@@ -341,7 +427,8 @@ def show_histogram(show_hist):
     Input('strategy','value')])
 def compute_histogram(n_clicks, num_nodes, strategy):
     """Once the "Compute Histogram" button is pressed, this callback
-    will compute the histogram using functions from simulations.py.
+    will start computing the histogram in a pool of processes (see HistogramPool).
+    The progress interval then keeps running, until the simulation is reset.
 
     Input arguments:
         n_clicks -- the number of times the button is clicked.
@@ -351,14 +438,11 @@ def compute_histogram(n_clicks, num_nodes, strategy):
             This is also read from the dropwdown menu in the UI.
     """
     if n_clicks is not None:
-        global computing_histogram
-        global generator
-        global num_sims
-        num_sims = 1000
-        computing_histogram = True
-        generator = simulate_generator(num_nodes, strategy, num_sim=num_sims)
-        t = next(generator)
-        return "Computing...", num_sims
+        global histogram_job
+        global histogram_shown
+        histogram_job = histogram_pool.submit(num_nodes, strategy, num_sims)
+        histogram_shown = False
+        return "Computing...", -1
     return "Compute Histogram", 0
 
 @app.callback(
@@ -375,25 +459,27 @@ def update_progress_bar(n_intervals, old_fig):
     the width of the compute histogram button. This causes the illusion of
     the button (which is the container both buttons are in) gets filled with
     a green colour, but it actually some CSS magic.
+    The width is the fraction of the simulations of the histogram job that are done,
+    and the histogram shows the results of those simulations.
     """
-    global computing_histogram
-    global generator
-    global num_sims
-    global timesteps_counter
+    global histogram_shown
 
     hist = old_fig
-    if computing_histogram:
-        try:
-            timesteps_counter = next(generator)
-        except StopIteration:
-            computing_histogram = False
-
-    # Only make a histogram every 3 intervals (or when the end is reached,
-    # otherwise it starts to lag hard
-    if n_intervals % 3 == 0 or not computing_histogram:
-        hist = make_histogram_for_frontend(timesteps_counter)
-
-    prog_bar_width = 100*n_intervals/num_sims
+    num_done = 0
+    if histogram_job is not None:
+        if histogram_shown:
+            raise PreventUpdate
+        finished = histogram_job.is_finished()
+        num_done = histogram_job.num_done
+        if histogram_job.error is not None:
+            print(f"Computing the histogram failed: {histogram_job.error}")
+        # Only make a histogram every 3 intervals (or when the end is reached),
+        # otherwise it starts to lag hard
+        if n_intervals % 3 == 0 or finished:
+            hist = make_histogram_for_frontend(histogram_job.timesteps_counter())
+        histogram_shown = finished
+
+    prog_bar_width = 100*num_done/num_sims
     comp_hist_width = 100 - prog_bar_width
     prog_bar_style = {
         "width":f"{prog_bar_width}%",
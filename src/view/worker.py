@@ -0,0 +1,323 @@
+"""worker.py runs the simulations of the UI in the background.
+
+A SimulationWorker owns the Controller of the UI. While the simulation is running,
+it makes the time-steps one after the other, and after every time-step it
+publishes a Snapshot of what the UI shows into a bounded ring buffer. The Dash
+callbacks only read the latest snapshot, so a slow time-step never blocks the
+server, and the simulation does not wait for the round trip of a callback.
+The callbacks change the simulation through the methods of the worker, which
+hold the lock of the controller.
+
+A HistogramJob runs the simulations of a histogram in the pool of worker processes
+of a HistogramPool, which is reused for every histogram, and merges the results of
+every work unit into its counter as soon as they come in.
+The strategies the batch engine supports are simulated with it, all simulations
+of a work unit together.
+"""
+
+import collections
+import multiprocessing
+import threading
+import time
+from modelController.batch_model import simulate_batch
+from modelController.protocols import STANDARD
+from modelController.strategies import get_strategy
+from simulations import MAX_TIMESTEPS, make_work_units, simulate_chunk
+
+# The number of snapshots the ring buffer keeps, older snapshots are dropped
+SNAPSHOT_BUFFER = 16
+
+# The number of simulations in a work unit of a HistogramJob
+HISTOGRAM_CHUNK = 25
+
+
+class Snapshot:
+    """The state of the simulation after a time-step, as far as the UI shows it.
+
+    The snapshot is never changed after it is published, so it can be read by
+    the callbacks while the worker goes on with the simulation.
+    """
+
+    __slots__ = ('run', 'timesteps_taken', 'num_agents', 'topology', 'labels', 'secret_counts', 'connections',
+                 'finished')
+
+    def __init__(self, run, timesteps_taken, num_agents, topology, labels, secret_counts, connections, finished):
+        """Initialises the snapshot.
+
+        Input arguments:
+        run -- The number of the simulation, which changes when the simulation is
+            reset or changed, so run and timesteps_taken identify the snapshot.
+        timesteps_taken -- The number of time-steps taken so far.
+        num_agents -- The number of agents.
+        topology -- The Topology the agents call each other over, None if complete.
+        labels -- A tuple with the name of every agent.
+        secret_counts -- A tuple with the number of secrets every agent knows.
+        connections -- A tuple with the (agent id, agent id) pairs that called each
+            other in the last time-step.
+        finished -- True if the simulation is finished.
+        """
+        self.run = run
+        self.timesteps_taken = timesteps_taken
+        self.num_agents = num_agents
+        self.topology = topology
+        self.labels = labels
+        self.secret_counts = secret_counts
+        self.connections = connections
+        self.finished = finished
+
+
+class SimulationWorker(threading.Thread):
+    """A daemon thread that runs the simulation of a Controller."""
+
+    def __init__(self, controller, step_interval=0.0):
+        """Initialises the worker, and publishes the first snapshot.
+
+        Input arguments:
+        controller -- The Controller of the simulation.
+        step_interval -- The minimum time between two time-steps, in seconds. A
+            time-step that takes longer is followed by the next one right away.
+        """
+        super().__init__(daemon=True)
+        self.controller = controller
+        self.step_interval = step_interval
+        self.lock = threading.Lock()
+        # Set while the simulation is running, the worker waits for it otherwise
+        self.wake = threading.Event()
+        self.snapshots = collections.deque(maxlen=SNAPSHOT_BUFFER)
+        self.labels = ()
+        self.run_number = 0
+        with self.lock:
+            self.publish()
+
+    def publish(self):
+        """Adds a snapshot of the simulation to the ring buffer. The lock has to be held."""
+        model = self.controller.model
+        if len(self.labels) != model.num_agents:
+            self.labels = tuple(str(agent) for agent in model.agents)
+        self.snapshots.append(Snapshot(self.run_number, self.controller.timesteps_taken, model.num_agents, model.topology,
+                                       self.labels, tuple(model.secret_counts()), tuple(model.connections),
+                                       self.controller.simulation_finished))
+
+    def latest(self):
+        """Returns the latest snapshot."""
+        return self.snapshots[-1]
+
+    def find(self, run, timesteps_taken):
+        """Returns the snapshot of a run after timesteps_taken time-steps, or None if it
+        is not in the ring buffer (anymore)."""
+        for snapshot in list(self.snapshots):
+            if snapshot.run == run and snapshot.timesteps_taken == timesteps_taken:
+                return snapshot
+        return None
+
+    def is_running(self):
+        """Returns True if the simulation has started, and is not paused or finished."""
+        controller = self.controller
+        return controller.started and not controller.paused and not controller.simulation_finished
+
+    def run(self):
+        """Makes the time-steps of the simulation while it is running."""
+        while True:
+            self.wake.wait()
+            start = time.perf_counter()
+            with self.lock:
+                if not self.is_running():
+                    self.wake.clear()
+                    continue
+                self.controller.simulate(print_message=False)
+                self.publish()
+            time.sleep(max(0.0, self.step_interval - (time.perf_counter() - start)))
+
+    def is_unchanged(self, num_agents, strategy):
+        """Returns True if the simulation has started, or already has this number of
+        agents and strategy, so update does not have to change anything."""
+        model = self.controller.model
+        return self.controller.started or (num_agents == model.num_agents and strategy == model.strategy)
+
+    def update(self, num_agents, strategy):
+        """Changes the number of agents and the strategy, if the simulation has not started.
+
+        This is called on every update of the UI, so it first checks without the lock
+        whether anything changes. Otherwise every update would wait for the time-step
+        that is being made. The check is repeated with the lock held.
+        """
+        if self.is_unchanged(num_agents, strategy):
+            return
+        with self.lock:
+            if self.is_unchanged(num_agents, strategy):
+                return
+            self.controller.update(num_agents, strategy)
+            self.run_number += 1
+            self.publish()
+
+    def start_simulation(self):
+        """Starts the simulation."""
+        with self.lock:
+            self.controller.start_simulation()
+            self.wake.set()
+
+    def pause_simulation(self):
+        """Pauses the simulation, the worker stops after the current time-step."""
+        with self.lock:
+            self.controller.pause_simulation()
+
+    def resume_simulation(self):
+        """Resumes the simulation."""
+        with self.lock:
+            self.controller.resume_simulation()
+            self.wake.set()
+
+    def reset_simulation(self):
+        """Resets the simulation, with the same number of agents and strategy."""
+        with self.lock:
+            num_agents = self.controller.model.num_agents
+            strategy = self.controller.model.strategy
+            self.controller.reset_simulation()
+            self.controller.update(num_agents, strategy)
+            self.run_number += 1
+            self.publish()
+
+
+def simulate_histogram_chunk(work_unit):
+    """Performs a work unit of a HistogramJob, in a worker process.
+
+    Input arguments:
+    work_unit -- A work unit made by simulations.make_work_units
+
+    Output:
+    counter -- A dictionary with as keys the timesteps taken and as values the
+        number of simulations of the work unit that took them.
+    """
+    num_agents, strategy, protocol, seed_sequence, num_sim = work_unit[:5]
+    if get_strategy(strategy).batched_matching is not None:
+        counter = simulate_batch(num_agents, strategy, num_sim, seed=seed_sequence, protocol=protocol,
+                                 max_timesteps=MAX_TIMESTEPS)
+        return {int(timesteps): count for timesteps, count in counter.items()}
+    counter = {}
+    timesteps_taken, _ = simulate_chunk(work_unit)
+    for timesteps in timesteps_taken:
+        counter[timesteps] = counter.get(timesteps, 0) + 1
+    return counter
+
+
+class HistogramJob:
+    """The simulations of a histogram, run in the pool of worker processes of a
+    HistogramPool.
+
+    The results of every work unit are merged into the counter by the result
+    thread of the pool, so the progress is the number of simulations that are
+    actually done. The callbacks of the result thread only record what happened,
+    stopping the pool is left to the HistogramPool.
+    """
+
+    def __init__(self, pool, num_agents, strategy, num_sim, seed=None):
+        """Starts the simulations.
+
+        Input arguments:
+        pool -- The multiprocessing.Pool the simulations are run in.
+        num_agents -- The number of agents in a simulation.
+        strategy -- The strategy the agents will use.
+        num_sim -- The number of simulations.
+        seed -- The seed of the simulations, None for a random seed.
+        """
+        self.num_sim = num_sim
+        self.num_done = 0
+        # The error message if a work unit failed, None otherwise
+        self.error = None
+        self.lock = threading.Lock()
+        self.counter = {}
+        work_units = make_work_units([(num_agents, strategy, STANDARD)], num_sim, HISTOGRAM_CHUNK, seed)
+        # The number of work units that are not done (or failed) yet
+        self.num_pending = len(work_units)
+        for work_unit in work_units:
+            pool.apply_async(simulate_histogram_chunk, (work_unit,), callback=self.add_results,
+                             error_callback=self.add_error)
+
+    def add_results(self, counter):
+        """Merges the counter of a work unit into the counter."""
+        with self.lock:
+            for timesteps, count in counter.items():
+                self.counter[timesteps] = self.counter.get(timesteps, 0) + count
+            self.num_done += sum(counter.values())
+            self.num_pending -= 1
+
+    def add_error(self, error):
+        """Records that a work unit failed, which stops the job."""
+        with self.lock:
+            if self.error is None:
+                self.error = str(error)
+            self.num_pending -= 1
+
+    def is_finished(self):
+        """Returns True if all simulations are done, or the job failed or was cancelled."""
+        return self.num_done == self.num_sim or self.error is not None
+
+    def timesteps_counter(self):
+        """Returns a copy of the counter, with as keys the timesteps taken (as strings,
+        in increasing order) and as values the number of simulations that took them."""
+        with self.lock:
+            return {str(timesteps): self.counter[timesteps] for timesteps in sorted(self.counter)}
+
+
+class HistogramPool:
+    """Owns the pool of worker processes the HistogramJobs run in.
+
+    The pool is made for the first job and reused by the jobs after it. Only one
+    job runs at a time: submitting a job cancels the job before it. The work
+    units a pool was given cannot be taken back, so cancelling a job that still
+    has work units terminates the pool, and a new pool is made for the next job.
+    The pool is only ever terminated by the threads that call these methods,
+    never by the result thread of the pool.
+    """
+
+    def __init__(self, processes=None):
+        """Initialises the owner, the pool is only made once a job is submitted.
+
+        Input arguments:
+        processes -- The number of worker processes, None for the number of CPUs.
+        """
+        self.processes = processes
+        self.lock = threading.Lock()
+        self.pool = None
+        self.job = None
+
+    def submit(self, num_agents, strategy, num_sim, seed=None):
+        """Cancels the running job, and starts the simulations of a new HistogramJob.
+
+        The arguments are passed to HistogramJob, which is returned.
+        """
+        with self.lock:
+            self.cancel_job()
+            if self.pool is None:
+                self.pool = multiprocessing.Pool(self.processes)
+            self.job = HistogramJob(self.pool, num_agents, strategy, num_sim, seed)
+            return self.job
+
+    def cancel(self):
+        """Stops the simulations of the running job that are not done yet."""
+        with self.lock:
+            self.cancel_job()
+
+    def cancel_job(self):
+        """Cancels the running job. The lock has to be held."""
+        job = self.job
+        self.job = None
+        if job is None:
+            return
+        if job.error is None and not job.is_finished():
+            job.error = "Cancelled"
+        if job.num_pending > 0:
+            self.terminate_pool()
+
+    def terminate_pool(self):
+        """Terminates the worker processes and waits for them. The lock has to be held."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def close(self):
+        """Cancels the running job and stops the worker processes."""
+        with self.lock:
+            self.cancel_job()
+            self.terminate_pool()